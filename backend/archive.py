@@ -0,0 +1,375 @@
+"""Archivo frío por meses: los días pasados y cerrados salen de la base viva.
+
+Las tareas done, cancelled o postponed con fecha anterior a ARCHIVE_AFTER_DAYS se
+mueven, junto con sus task_patterns, a una base por mes (archive/agenda-2025-03.db,
+o archive/<usuario>/2025-03.db para los shards de usuario).
+La base del mes se adjunta con ATTACH solo mientras se usa, y la tabla
+archived_months de la base viva dice qué meses tienen archivo: las lecturas
+calientes no abren ningún fichero frío.
+
+El mantenimiento (archivar, incremental_vacuum y ANALYZE) corre en un hilo propio
+con una conexión fuera del pool y en autocommit, porque ATTACH y VACUUM no pueden
+ir dentro de una transacción.
+
+    python archive.py [--before 2025-01-01] [--user ana]   # una pasada a mano
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import metrics
+import queries
+from database import (DB_NAME, DEFAULT_USER, FTS_SCHEMA, current_user, open_connection,
+                      shard_path, shard_users, use_user)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(DB_NAME) or ".", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "21600"))   # segundos; 0 = sin hilo
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "0"))                 # 0 = toda la lista libre
+ANALYSIS_LIMIT = int(os.getenv("ANALYSIS_LIMIT", "1000"))          # filas muestreadas por índice
+
+ARCHIVE_STATUSES = ("done", "cancelled", "postponed")
+
+log = logging.getLogger("agenda.archive")
+
+# Mismo esquema que las tablas vivas, sin triggers: el archivo solo se lee
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {db}.tasks (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        context TEXT,
+        priority INTEGER DEFAULT 2,
+        pomodoros INTEGER DEFAULT 1,
+        pomodoros_done INTEGER DEFAULT 0,
+        target_hour TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at DATETIME,
+        done_at DATETIME,
+        date TEXT NOT NULL,
+        position INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS {db}.idx_tasks_date_position_id ON tasks(date, position, id);
+    CREATE TABLE IF NOT EXISTS {db}.task_patterns (
+        task_id             TEXT PRIMARY KEY,
+        date                TEXT NOT NULL,
+        target_hour         TEXT,
+        estimated_pomodoros INTEGER NOT NULL DEFAULT 1,
+        actual_pomodoros    INTEGER NOT NULL DEFAULT 1,
+        was_completed       INTEGER NOT NULL DEFAULT 0,
+        recorded_at         DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS {db}.idx_task_patterns_date_completed
+        ON task_patterns(date, was_completed, target_hour);
+"""
+
+TASK_COLUMNS = ("id", "title", "context", "priority", "pomodoros", "pomodoros_done",
+                "target_hour", "status", "created_at", "done_at", "date", "position")
+PATTERN_COLUMNS = ("task_id", "date", "target_hour", "estimated_pomodoros",
+                   "actual_pomodoros", "was_completed", "recorded_at")
+
+
+def month_path(month: str) -> str:
+    user = current_user.get()
+    if user != DEFAULT_USER:
+        return os.path.join(ARCHIVE_DIR, user, f"{month}.db")
+    stem = os.path.splitext(os.path.basename(DB_NAME))[0] or "agenda"
+    return os.path.join(ARCHIVE_DIR, f"{stem}-{month}.db")
+
+
+def archived_months(conn, desde: str | None = None, hasta: str | None = None) -> list[str]:
+    """Meses con archivo que solapan [desde, hasta] (fechas completas o meses)."""
+    rows = conn.execute(
+        queries.ARCHIVED_MONTHS, ((desde or "0000")[:7], (hasta or "9999")[:7]),
+    ).fetchall()
+    return [r["month"] for r in rows]
+
+
+def _schema(month: str) -> str:
+    return "arch_" + month.replace("-", "_")
+
+
+@contextmanager
+def attached(conn, months: list[str]):
+    """Adjunta las bases de `months` y devuelve sus esquemas; las separa al salir.
+
+    SQLite limita los ATTACH simultáneos (10 por defecto): quien recorra muchos meses
+    debe hacerlo por tandas, como `task_patterns`.
+    """
+    schemas = []
+    try:
+        for month in months:
+            schema = _schema(month)
+            conn.execute("ATTACH DATABASE ? AS " + schema, (month_path(month),))
+            schemas.append(schema)
+        yield schemas
+    finally:
+        for schema in schemas:
+            conn.execute("DETACH DATABASE " + schema)
+
+
+def cold_rows(conn, desde: str, hasta: str, sql: str, params) -> list[dict]:
+    """Ejecuta `sql` (escrito contra `tasks`) en cada mes archivado de [desde, hasta]."""
+    return cold_map(conn, desde, hasta, lambda cold: [dict(r) for r in cold.execute(sql, params)])
+
+
+def cold_map(conn, desde: str, hasta: str, fn) -> list[dict]:
+    """Llama a fn(conexión) en cada mes archivado de [desde, hasta] y junta las filas.
+
+    Cada fichero se abre en solo lectura y por separado, sin ATTACH sobre la
+    conexión del pool; quien llama mezcla y ordena con las filas vivas.
+    """
+    rows = []
+    for month in archived_months(conn, desde, hasta):
+        try:
+            cold = sqlite3.connect(f"file:{month_path(month)}?mode=ro", uri=True)
+        except sqlite3.OperationalError as e:
+            log.warning("archivo %s ilegible: %r", month, e)
+            continue
+        cold.row_factory = sqlite3.Row
+        try:
+            rows.extend(fn(cold))
+        except sqlite3.OperationalError as e:
+            log.warning("archivo %s ilegible: %r", month, e)
+        finally:
+            cold.close()
+    return rows
+
+
+def sql_order(*values) -> tuple:
+    # Clave de ordenación de Python con NULL primero, como ORDER BY en SQLite
+    return tuple((v is not None, v) for v in values)
+
+
+def task_patterns(desde: str, hasta: str, conn=None) -> list[dict]:
+    """task_patterns de [desde, hasta] en ambos niveles, ordenados por fecha.
+
+    `conn` no puede tener una transacción abierta (ATTACH no se permite dentro);
+    sin ella se usa una conexión propia.
+
+    Un mismo task_id solo puede estar dos veces si una pasada se cortó entre la
+    copia y el borrado; en ese caso gana la fila viva.
+    """
+    own = conn is None
+    conn = conn or open_connection()
+    columns = ", ".join(PATTERN_COLUMNS)
+    try:
+        result = {
+            r["task_id"]: dict(r) for r in conn.execute(
+                f"SELECT {columns} FROM task_patterns WHERE date BETWEEN ? AND ?", (desde, hasta)
+            )
+        }
+        months = archived_months(conn, desde, hasta)
+        batch = max(1, conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - len(_attached(conn)))
+        for i in range(0, len(months), batch):
+            with attached(conn, months[i:i + batch]) as schemas:
+                sql = " UNION ALL ".join(
+                    f"SELECT {columns} FROM {s}.task_patterns WHERE date BETWEEN ? AND ?"
+                    for s in schemas
+                )
+                for r in conn.execute(sql, (desde, hasta) * len(schemas)):
+                    result.setdefault(r["task_id"], dict(r))
+    finally:
+        if own:
+            conn.close()
+    return sorted(result.values(), key=lambda p: sql_order(p["date"], p["target_hour"], p["task_id"]))
+
+
+def _attached(conn) -> list[str]:
+    return [r["name"] for r in conn.execute("PRAGMA database_list") if r["name"] not in ("main", "temp")]
+
+
+# --- Archivado ---
+
+def archive_before(cutoff: str, conn=None) -> dict:
+    """Mueve al archivo las tareas cerradas con date < cutoff. Devuelve los conteos por mes."""
+    own = conn is None
+    conn = conn or open_connection()
+    placeholders = ", ".join("?" * len(ARCHIVE_STATUSES))
+    moved = {}
+    try:
+        months = [r["month"] for r in conn.execute(f"""
+            SELECT DISTINCT substr(date, 1, 7) AS month FROM tasks
+            WHERE date < ? AND status IN ({placeholders})
+        """, (cutoff, *ARCHIVE_STATUSES))]
+        for month in months:
+            os.makedirs(os.path.dirname(month_path(month)), exist_ok=True)
+            moved[month] = _archive_month(conn, month, cutoff)
+    finally:
+        if own:
+            conn.close()
+    return moved
+
+
+def _archive_month(conn, month: str, cutoff: str) -> dict:
+    first = month + "-01"
+    # Límite superior exclusivo: el cutoff o el primer día del mes siguiente
+    nxt = (date.fromisoformat(first) + timedelta(days=31)).replace(day=1)
+    upper = min(cutoff, str(nxt))
+    where = f"date >= ? AND date < ? AND status IN ({', '.join('?' * len(ARCHIVE_STATUSES))})"
+    params = (first, upper, *ARCHIVE_STATUSES)
+
+    with attached(conn, [month]) as (schema,):
+        indexed = conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'tasks_fts'"
+        ).fetchone()
+        conn.executescript(ARCHIVE_SCHEMA.format(db=schema) + FTS_SCHEMA.format(db=schema))
+        if not indexed:
+            # Archivo anterior a la búsqueda de texto: se indexa lo que ya tenía
+            conn.execute(f"INSERT INTO {schema}.tasks_fts (tasks_fts) VALUES ('rebuild')")
+        # Con WAL, un commit que abarca varias bases no es atómico entre ellas: por eso se
+        # copia antes de borrar y la copia es idempotente. Si se corta a medias, la tarea
+        # queda en ambos niveles (las lecturas prefieren la viva) y la siguiente pasada termina
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = f"SELECT id FROM main.tasks WHERE {where}"
+            # DELETE + INSERT y no INSERT OR REPLACE: REPLACE no dispara los triggers del índice FTS
+            conn.execute(f"DELETE FROM {schema}.tasks WHERE id IN ({ids})", params)
+            tasks = conn.execute(f"""
+                INSERT INTO {schema}.tasks ({', '.join(TASK_COLUMNS)})
+                SELECT {', '.join(TASK_COLUMNS)} FROM main.tasks WHERE {where}
+            """, params).rowcount
+            patterns = conn.execute(f"""
+                INSERT OR REPLACE INTO {schema}.task_patterns ({', '.join(PATTERN_COLUMNS)})
+                SELECT {', '.join(PATTERN_COLUMNS)} FROM main.task_patterns WHERE task_id IN ({ids})
+            """, params).rowcount
+
+            # Los triggers de daily_stats descontarían estas tareas: el histórico se conserva
+            stats = conn.execute(
+                "SELECT * FROM daily_stats WHERE date >= ? AND date < ?", (first, upper)
+            ).fetchall()
+            conn.execute(f"DELETE FROM main.task_patterns WHERE task_id IN ({ids})", params)
+            conn.execute(f"DELETE FROM main.tasks WHERE {where}", params)
+            if stats:
+                columns = stats[0].keys()
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO daily_stats ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(r) for r in stats],
+                )
+            # Archivar no es borrar: sin lápidas en /changes para días cerrados
+            conn.execute(f"""
+                DELETE FROM task_changes WHERE date >= ? AND date < ? AND task_id IN (
+                    SELECT id FROM {schema}.tasks WHERE date >= ? AND date < ?)
+            """, (first, upper, first, upper))
+            conn.execute("""
+                INSERT INTO archived_months (month, tasks, patterns) VALUES (?, ?, ?)
+                ON CONFLICT(month) DO UPDATE SET
+                    tasks       = tasks + excluded.tasks,
+                    patterns    = patterns + excluded.patterns,
+                    archived_at = CURRENT_TIMESTAMP
+            """, (month, tasks, patterns))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute(f"PRAGMA {schema}.analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute(f"ANALYZE {schema}")
+
+    metrics.inc("archive_tasks_total", tasks)
+    log.info("archivado %s: %s tareas, %s patrones", month, tasks, patterns)
+    return {"tasks": tasks, "patterns": patterns}
+
+
+# --- Mantenimiento ---
+
+def maintenance(cutoff: str | None = None) -> dict:
+    """Archiva, devuelve páginas libres al sistema y refresca las estadísticas del planner.
+
+    Trabaja sobre el shard del usuario actual.
+    """
+    cutoff = cutoff or str(date.today() - timedelta(days=ARCHIVE_AFTER_DAYS))
+    conn = open_connection()
+    try:
+        start = time.perf_counter()
+        moved = archive_before(cutoff, conn)
+        metrics.observe("maintenance_seconds", time.perf_counter() - start, step="archive")
+
+        start = time.perf_counter()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Base creada antes de auto_vacuum = INCREMENTAL: el cambio exige un VACUUM completo
+            log.info("convirtiendo %s a auto_vacuum incremental", shard_path(current_user.get()))
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            # VACUUM puede renumerar los rowid de tasks, que son las claves del índice FTS
+            conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        metrics.observe("maintenance_seconds", time.perf_counter() - start, step="vacuum")
+
+        start = time.perf_counter()
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE main")
+        metrics.observe("maintenance_seconds", time.perf_counter() - start, step="analyze")
+    finally:
+        conn.close()
+    return {"cutoff": cutoff, "months": moved, "freed_pages": freed}
+
+
+def maintenance_all(cutoff: str | None = None) -> dict:
+    """maintenance() en el shard de cada usuario; el fallo de uno no para a los demás."""
+    results = {}
+    for user in shard_users():
+        with use_user(user):
+            try:
+                results[user] = maintenance(cutoff)
+            except Exception as e:
+                log.exception("mantenimiento de %s fallido", user)
+                results[user] = {"error": repr(e)}
+    return results
+
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def start(interval: float = ARCHIVE_INTERVAL) -> None:
+    global _thread
+    if interval <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(interval,), name="archive", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5.0) -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        _thread = None
+
+
+def _loop(interval: float) -> None:
+    # Primera pasada poco después de arrancar, luego una por intervalo
+    delay = min(interval, 60.0)
+    while not _stop.wait(delay):
+        try:
+            maintenance_all()
+        except Exception:
+            log.exception("mantenimiento fallido")
+        delay = interval
+
+
+metrics.describe("archive_tasks_total", "Tareas movidas de la base viva al archivo mensual")
+metrics.describe("maintenance_seconds", "Duración del mantenimiento por paso")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--before", help="archiva lo anterior a esta fecha (YYYY-MM-DD)")
+    ap.add_argument("--user", help="solo el shard de este usuario")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.user:
+        with use_user(args.user):
+            print(json.dumps(maintenance(args.before), indent=2))
+    else:
+        print(json.dumps(maintenance_all(args.before), indent=2))
@@ -0,0 +1,15 @@
+"""Sustituto local y determinista del LLM para benchmarks.
+
+Reemplaza los proveedores del router de llm_parser por un StubProvider (el mismo
+parser local que sirve stub_llm.py), con una latencia fija configurable.
+"""
+from providers import StubProvider
+
+
+def install(latency: float = 0.0, fail_rate: float = 0.0) -> StubProvider:
+    """Instala el stub como único proveedor. Devuelve el proveedor para contar llamadas."""
+    import llm_parser
+
+    stub = StubProvider(latency, fail_rate)
+    llm_parser.router.providers = [stub]
+    return stub
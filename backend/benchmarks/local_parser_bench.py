@@ -0,0 +1,108 @@
+"""Precisión y latencia del parser local frente a un corpus etiquetado.
+
+Uso (desde backend/):
+    python benchmarks/local_parser_bench.py [--llm-ms 900] [--json]
+
+Para cada umbral de confianza informa qué fracción de entradas se resuelve
+localmente, la precisión por campo en esas entradas y la latencia media
+esperada del modo híbrido suponiendo --llm-ms por llamada al LLM.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_parser import parse_local  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parse_corpus.jsonl")
+FIELDS = ("title", "priority", "pomodoros", "target_hour")
+THRESHOLDS = (0.5, 0.6, 0.65, 0.7, 0.8, 0.9)
+
+
+def load_corpus(path: str = CORPUS) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _matches(field, got, expected) -> bool:
+    if field == "title":
+        return (got or "").casefold().strip() == (expected or "").casefold().strip()
+    return got == expected
+
+
+def run(corpus: list[dict], llm_ms: float, repeat: int = 200) -> dict:
+    rows = []
+    for item in corpus:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result, confidence = parse_local(item["texto"])
+        elapsed_us = (time.perf_counter() - start) / repeat * 1e6
+        hits = {f: _matches(f, result.get(f), item["expected"][f]) for f in FIELDS}
+        rows.append({"texto": item["texto"], "confidence": confidence,
+                     "latency_us": elapsed_us, "hits": hits})
+
+    latencies = sorted(r["latency_us"] for r in rows)
+    report = {
+        "corpus_size": len(rows),
+        "local_latency_us": {
+            "mean": round(statistics.mean(latencies), 2),
+            "p95": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        },
+        "thresholds": [],
+    }
+    for threshold in THRESHOLDS:
+        handled = [r for r in rows if r["confidence"] >= threshold]
+        coverage = len(handled) / len(rows)
+        accuracy = {
+            f: round(sum(r["hits"][f] for r in handled) / len(handled), 3) if handled else None
+            for f in FIELDS
+        }
+        exact = round(sum(all(r["hits"].values()) for r in handled) / len(handled), 3) if handled else None
+        local_ms = sum(r["latency_us"] for r in handled) / 1000
+        expected_ms = (local_ms + (len(rows) - len(handled)) * llm_ms) / len(rows)
+        report["thresholds"].append({
+            "threshold": threshold,
+            "coverage": round(coverage, 3),
+            "field_accuracy": accuracy,
+            "exact_match": exact,
+            "expected_mean_latency_ms": round(expected_ms, 2),
+        })
+    report["misses"] = [
+        {"texto": r["texto"], "confidence": r["confidence"],
+         "wrong": [f for f, ok in r["hits"].items() if not ok]}
+        for r in rows if not all(r["hits"].values())
+    ]
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--llm-ms", type=float, default=900.0,
+                    help="latencia supuesta de una llamada al LLM")
+    ap.add_argument("--json", action="store_true", help="imprime el informe como JSON")
+    args = ap.parse_args()
+
+    report = run(load_corpus(), args.llm_ms)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    lat = report["local_latency_us"]
+    print(f"Corpus: {report['corpus_size']} entradas | parser local: "
+          f"media {lat['mean']} µs, p95 {lat['p95']} µs")
+    print(f"{'umbral':>7} {'cobertura':>10} {'exacto':>7} {'título':>7} {'prio':>6} "
+          f"{'pomo':>6} {'hora':>6} {'ms medios':>10}")
+    for t in report["thresholds"]:
+        acc = t["field_accuracy"]
+        fmt = lambda v: "-" if v is None else f"{v:.2f}"  # noqa: E731
+        print(f"{t['threshold']:>7} {t['coverage']:>10.2f} {fmt(t['exact_match']):>7} "
+              f"{fmt(acc['title']):>7} {fmt(acc['priority']):>6} {fmt(acc['pomodoros']):>6} "
+              f"{fmt(acc['target_hour']):>6} {t['expected_mean_latency_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
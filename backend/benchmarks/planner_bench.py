@@ -0,0 +1,121 @@
+"""Escalado del motor de planificación frente al planificador voraz original.
+
+Uso (desde backend/):
+    python benchmarks/planner_bench.py [--json]
+
+Genera backlogs sintéticos (mezcla de tareas fijas y libres, con solapes) y
+planifica horizontes de varias semanas. El voraz no arrastra tareas entre días,
+así que aquí se le da la misma vuelta: lo que no cabe se reintenta al día siguiente.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import generate_agenda, plan_days  # noqa: E402
+
+WEIGHTS = {"morning_weight": 1.0, "priority_weight": 1.0,
+           "pomodoro_accuracy": 1.0, "preferred_start_hour": 9.0}
+SIZES = ((100, 7), (1000, 14), (5000, 28), (10000, 56))
+
+
+def synthetic_backlog(n: int, days: int, anchored_ratio: float = 0.2, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    start = date(2026, 1, 5)
+    tasks = []
+    for i in range(n):
+        anchored = rng.random() < anchored_ratio
+        tasks.append({
+            "id": f"t{i}",
+            "title": f"Tarea {i}",
+            "priority": rng.choice((1, 2, 2, 3)),
+            "pomodoros": rng.choice((1, 1, 2, 3, 4)),
+            "target_hour": f"{rng.randint(8, 19):02d}:{rng.choice((0, 15, 30, 45)):02d}" if anchored else None,
+            "date": str(start + timedelta(days=rng.randrange(days))),
+        })
+    return tasks
+
+
+def greedy_horizon(tasks: list[dict], start_date: str, days: int) -> dict:
+    first = date.fromisoformat(start_date)
+    by_date: dict[str, list] = {}
+    for t in tasks:
+        by_date.setdefault(t["date"], []).append(t)
+    carry, placed, overlaps = [], 0, 0
+    for i in range(days):
+        d = str(first + timedelta(days=i))
+        day = [dict(t) for t in by_date.get(d, [])] + [dict(t, target_hour=None) for t in carry]
+        planned = generate_agenda(day, d, WEIGHTS, strategy="greedy")
+        timed = [t for t in planned if t["suggested_start"]]
+        placed += len(timed)
+        overlaps += _count_overlaps(timed)
+        carry = [t for t in planned if not t["suggested_start"]]
+    return {"placed": placed, "unplaced": len(carry), "overlaps": overlaps}
+
+
+def engine_horizon(tasks: list[dict], start_date: str, days: int, strategy: str) -> dict:
+    result = plan_days([dict(t) for t in tasks], start_date, days, WEIGHTS, strategy)
+    placed = sum(len(v) for v in result["days"].values())
+    overlaps = sum(_count_overlaps(v) for v in result["days"].values())
+    return {"placed": placed, "unplaced": len(result["unplaced"]), "overlaps": overlaps}
+
+
+def _count_overlaps(planned: list[dict]) -> int:
+    spans = sorted(
+        (_minutes(t["suggested_start"]), _minutes(t["suggested_start"]) + t["pomodoros"] * 25)
+        for t in planned
+    )
+    return sum(1 for a, b in zip(spans, spans[1:]) if b[0] < a[1])
+
+
+def _minutes(hhmm: str) -> int:
+    h, m = map(int, hhmm.split(":"))
+    return h * 60 + m
+
+
+def _timed(fn, *args, repeat: int = 3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2), result
+
+
+def run() -> list[dict]:
+    rows = []
+    for n, days in SIZES:
+        tasks = synthetic_backlog(n, days)
+        start = "2026-01-05"
+        ms, stats = _timed(greedy_horizon, tasks, start, days)
+        rows.append({"tasks": n, "days": days, "planner": "greedy", "ms": ms} | stats)
+        for strategy in ("priority", "best_fit"):
+            ms, stats = _timed(engine_horizon, tasks, start, days, strategy)
+            rows.append({"tasks": n, "days": days, "planner": strategy, "ms": ms} | stats)
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--json", action="store_true", help="imprime los resultados como JSON")
+    args = ap.parse_args()
+
+    rows = run()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'tareas':>7} {'días':>5} {'planner':>9} {'ms':>9} {'colocadas':>10} "
+          f"{'sin hueco':>10} {'solapes':>8}")
+    for r in rows:
+        print(f"{r['tasks']:>7} {r['days']:>5} {r['planner']:>9} {r['ms']:>9} "
+              f"{r['placed']:>10} {r['unplaced']:>10} {r['overlaps']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Banco de pruebas reproducible del backend: planner, learner y API.
+
+Uso (desde backend/):
+    python benchmarks/run.py [--out resultados.json] [--compare base.json] [--quick]
+
+Crea una base de datos temporal con una carga sintética determinista
+(días con N tareas, M días de historial en task_patterns, mezclas de tareas
+fijas y libres), mide las funciones calientes directamente y lanza carga sobre
+los endpoints con TestClient y un LLM falso local. El resultado es JSON para
+poder comparar entre commits: con --compare se imprime la variación y el
+proceso sale con código 1 si algún caso empeora más que --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# La base de datos y la clave se fijan antes de importar los módulos del backend
+_TMP = tempfile.mkdtemp(prefix="agenda-bench-")
+os.environ["AGENDA_DB"] = os.path.join(_TMP, "bench.db")
+os.environ.setdefault("groq_api_key", "benchmark")
+
+import database  # noqa: E402
+import fake_llm  # noqa: E402
+import learner  # noqa: E402
+import planner  # noqa: E402
+
+START = date(2026, 1, 5)
+WEIGHTS = {"morning_weight": 1.0, "priority_weight": 1.0,
+           "pomodoro_accuracy": 1.0, "preferred_start_hour": 9.0}
+
+
+# --- Cargas sintéticas ---
+
+def make_tasks(rng: random.Random, n: int, day: str, anchored_ratio: float) -> list[dict]:
+    tasks = []
+    for i in range(n):
+        anchored = rng.random() < anchored_ratio
+        tasks.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "title": f"Tarea {i}",
+            "context": None,
+            "priority": rng.choice((1, 2, 2, 3)),
+            "pomodoros": rng.choice((1, 1, 2, 3, 4)),
+            "pomodoros_done": 0,
+            "target_hour": f"{rng.randint(8, 19):02d}:{rng.choice((0, 15, 30, 45)):02d}" if anchored else None,
+            "status": "pending",
+            "date": day,
+            "position": i,
+        })
+    return tasks
+
+
+def seed_history(conn: sqlite3.Connection, days: int, per_day: int, seed: int = 11) -> None:
+    """Inserta tareas, outcomes en task_patterns y feedback para `days` días."""
+    rng = random.Random(seed)
+    task_rows, pattern_rows, feedback_rows = [], [], []
+    for d in range(days):
+        day = str(START - timedelta(days=days - d))
+        for t in make_tasks(rng, per_day, day, anchored_ratio=0.6):
+            done = rng.random() < 0.7
+            t["status"] = "done" if done else rng.choice(("pending", "postponed"))
+            task_rows.append((t["id"], t["title"], t["priority"], t["pomodoros"],
+                              t["target_hour"], t["status"], day, t["position"]))
+            if done:
+                actual = max(1, t["pomodoros"] + rng.choice((-1, 0, 0, 1)))
+                pattern_rows.append((t["id"], day, t["target_hour"], t["pomodoros"], actual, 1))
+        feedback_rows.append((day, rng.randint(1, 5), per_day, per_day))
+    conn.executemany("""
+        INSERT INTO tasks (id, title, priority, pomodoros, target_hour, status, date, position)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, task_rows)
+    conn.executemany("""
+        INSERT INTO task_patterns
+            (task_id, date, target_hour, estimated_pomodoros, actual_pomodoros, was_completed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, pattern_rows)
+    conn.executemany("""
+        INSERT INTO feedback (date, score, tasks_done, tasks_total) VALUES (?, ?, ?, ?)
+    """, feedback_rows)
+
+
+# --- Medición ---
+
+def measure(name: str, fn, iterations: int, **params) -> dict:
+    fn()  # calentamiento
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return _summary(name, samples, params)
+
+
+def _summary(name: str, samples: list[float], params: dict) -> dict:
+    samples = sorted(samples)
+    return {
+        "name": name,
+        "params": params,
+        "iterations": len(samples),
+        "mean_ms": round(statistics.mean(samples), 4),
+        "p50_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 4),
+        "max_ms": round(samples[-1], 4),
+    }
+
+
+def bench_planner(quick: bool) -> list[dict]:
+    rng = random.Random(3)
+    results = []
+    for n in ((10, 50) if quick else (10, 50, 200)):
+        for ratio in (0.0, 0.3, 0.7):
+            tasks = make_tasks(rng, n, str(START), ratio)
+            for strategy in planner.STRATEGIES:
+                results.append(measure(
+                    f"generate_agenda[{strategy}]",
+                    lambda: planner.generate_agenda([dict(t) for t in tasks], str(START), WEIGHTS, strategy),
+                    iterations=50 if quick else 200,
+                    tasks=n, anchored_ratio=ratio,
+                ))
+    return results
+
+
+def bench_learner(quick: bool) -> list[dict]:
+    results = []
+    history_day = str(START - timedelta(days=1))
+    results.append(measure("get_planner_weights", learner.get_planner_weights,
+                           iterations=200 if quick else 1000))
+
+    def feedback():
+        # Cada iteración en su propia transacción revertida: los pesos no derivan
+        with database.get_db() as conn:
+            learner.process_feedback(history_day, 2, None, conn=conn)
+            conn.rollback()
+
+    results.append(measure("process_feedback", feedback, iterations=100 if quick else 500))
+    return results
+
+
+def bench_api(quick: bool, concurrency: int) -> list[dict]:
+    from fastapi.testclient import TestClient
+    import main
+
+    fake_llm.install()
+    results = []
+    day = str(START)
+    iterations = 100 if quick else 400
+
+    with TestClient(main.app) as client:
+        client.post("/tasks/bulk", json={"tasks": [
+            {"title": f"Tarea API {i}", "priority": 1 + i % 3, "pomodoros": 1 + i % 4,
+             "target_hour": "10:00" if i % 5 == 0 else None, "date": day}
+            for i in range(30)
+        ]})
+        ids = [t["id"] for t in client.get(f"/agenda/{day}").json()]
+        counter = iter(range(10 ** 9))
+
+        cases = {
+            "GET /agenda/{fecha}": lambda: client.get(f"/agenda/{day}"),
+            "GET /agenda/{fecha}/plan": lambda: client.get(f"/agenda/{day}/plan"),
+            "GET /learning/weights": lambda: client.get("/learning/weights"),
+            "POST /tasks": lambda: client.post("/tasks", json={"title": "nueva", "date": day}),
+            "PATCH /tasks/{id}": lambda: client.patch(
+                f"/tasks/{ids[next(counter) % len(ids)]}", json={"pomodoros_done": 1}),
+            "POST /parse": lambda: client.post(
+                "/parse", json={"texto": f"tarea variada {next(counter)}", "mode": "llm"}),
+            "POST /feedback": lambda: client.post("/feedback", json={"date": day, "score": 3}),
+        }
+        for name, call in cases.items():
+            results.append(measure(name, lambda: _ok(call()), iterations=iterations))
+
+        # Carga concurrente: lecturas baratas mientras hay tráfico de parseo
+        if concurrency > 1:
+            results.append(_concurrent(
+                "mixed read/parse load",
+                [cases["GET /agenda/{fecha}"], cases["POST /parse"]],
+                concurrency, iterations * 2,
+            ))
+    return results
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url}: {response.status_code} {response.text}")
+    return response
+
+
+def _concurrent(name: str, calls: list, concurrency: int, total: int) -> dict:
+    def one(i):
+        start = time.perf_counter()
+        _ok(calls[i % len(calls)]())
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    summary = _summary(name, samples, {"concurrency": concurrency})
+    summary["throughput_rps"] = round(total / elapsed, 1)
+    return summary
+
+
+# --- Informe y comparación ---
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _key(result: dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(base: dict, current: dict, tolerance: float) -> list[str]:
+    before = {_key(r): r for r in base["results"]}
+    regressions = []
+    print(f"\n{'caso':<60} {'antes':>10} {'ahora':>10} {'cambio':>8}")
+    for r in current["results"]:
+        old = before.get(_key(r))
+        if not old or not old["p50_ms"]:
+            continue
+        change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"]
+        label = f"{r['name']} {r['params'] or ''}"[:60]
+        flag = " !" if change > tolerance else ""
+        print(f"{label:<60} {old['p50_ms']:>10.3f} {r['p50_ms']:>10.3f} {change:>+7.0%}{flag}")
+        if change > tolerance:
+            regressions.append(label)
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", help="fichero JSON de salida (por defecto stdout)")
+    ap.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+                    help="empeoramiento relativo de p50 aceptado (0.2 = 20%%)")
+    ap.add_argument("--quick", action="store_true", help="menos iteraciones y tamaños")
+    ap.add_argument("--history-days", type=int, default=365)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    database.init_db()
+    with database.get_db() as conn:
+        seed_history(conn, days=90 if args.quick else args.history_days, per_day=12)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "quick": args.quick,
+        },
+        "results": bench_planner(args.quick) + bench_learner(args.quick)
+                   + bench_api(args.quick, args.concurrency),
+    }
+    database.close_pool()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    elif not args.compare:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} casos empeoran más de {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,665 @@
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date
 
-DB_NAME = "agenda.db"
+import metrics
+import queries
 
-def get_db():
-    conn = sqlite3.connect(DB_NAME)
+DB_NAME = os.getenv("AGENDA_DB", "agenda.db")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# PRAGMAs aplicados una sola vez por conexión, al abrirla
+PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL", # solo surte efecto en bases nuevas (ver archive.py)
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",       # ~16 MB de caché de páginas
+    "PRAGMA mmap_size = 134217728",     # 128 MB mapeados en memoria
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    factory = metrics.TimedConnection if metrics.ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(path, check_same_thread=False, factory=factory)
     conn.row_factory = sqlite3.Row  # para que podamos acceder por nombre de columna
+    metrics.instrument(conn)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+
+class ConnectionPool:
+    """Pool acotado de conexiones reutilizables.
+
+    Cada hilo toma como mucho una conexión: las llamadas anidadas a get_db()
+    dentro del mismo hilo (un endpoint que llama al learner, por ejemplo)
+    comparten la conexión y la transacción del nivel exterior.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def open(self) -> None:
+        """Abre las conexiones por adelantado (arranque de la app)."""
+        with self._lock:
+            self._closed = False
+            while self._opened < self.size:
+                self._idle.put(_connect(self.path))
+                self._opened += 1
+
+    def close(self) -> None:
+        """Cierra todas las conexiones ociosas (apagado de la app)."""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._opened -= 1
+
+    def in_use(self) -> int:
+        """Conexiones prestadas ahora mismo."""
+        return self._opened - self._idle.qsize()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return _connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("Pool de conexiones agotado") from None
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            with self._lock:
+                conn.close()
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            # Llamada anidada: la transacción la cierra el nivel exterior
+            yield current
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+
+# --- Shards: una base por usuario ---
+
+DEFAULT_USER = "default"                     # usa DB_NAME, la base de antes del multiusuario
+SHARD_DIR = os.getenv("SHARD_DIR") or os.path.join(os.path.dirname(DB_NAME) or ".", "users")
+MAX_OPEN_SHARDS = int(os.getenv("MAX_OPEN_SHARDS", "32"))
+SHARD_POOL_SIZE = int(os.getenv("SHARD_POOL_SIZE", "2"))
+SHARD_IDLE = float(os.getenv("SHARD_IDLE", "300"))      # segundos sin uso antes de cerrar
+
+USER_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Usuario de la petición en curso (lo fija el middleware de main.py)
+current_user: ContextVar[str] = ContextVar("current_user", default=DEFAULT_USER)
+
+
+def shard_path(user_id: str) -> str:
+    if user_id == DEFAULT_USER:
+        return DB_NAME
+    if not USER_ID.match(user_id):
+        raise ValueError(f"user_id no válido: {user_id!r}")
+    return os.path.join(SHARD_DIR, f"{user_id}.db")
+
+
+def shard_users() -> list[str]:
+    """Usuarios con base en disco (el de por defecto siempre)."""
+    try:
+        names = sorted(f[:-3] for f in os.listdir(SHARD_DIR) if f.endswith(".db"))
+    except FileNotFoundError:
+        names = []
+    return [DEFAULT_USER] + [n for n in names if USER_ID.match(n) and n != DEFAULT_USER]
+
+
+@contextmanager
+def use_user(user_id: str):
+    """Fija el usuario actual en este contexto (workers, mantenimiento, CLI)."""
+    token = current_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+class ShardManager:
+    """Pools abiertos por usuario, en un LRU acotado.
+
+    El pool de un usuario se crea (y su base se migra) en su primer uso. La migración
+    va fuera del lock general, con un lock por usuario: la primera petición de un
+    usuario nuevo no frena las de los demás. En cada acceso, si se pasa de
+    MAX_OPEN_SHARDS o hay pools sin uso desde hace SHARD_IDLE segundos, se cierran
+    los menos recientes, salvo los que tengan conexiones prestadas: cerrarlos
+    rompería la reentrada de get_db() dentro de la petición.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_SHARDS, idle: float = SHARD_IDLE):
+        self.max_open = max_open
+        self.idle = idle
+        self._pools: OrderedDict[str, list] = OrderedDict()     # usuario -> [pool, último uso]
+        self._migrated: set[str] = set()
+        self._migrating: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def pool(self, user_id: str | None = None) -> ConnectionPool:
+        user_id = user_id or current_user.get()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pools.get(user_id)
+            if entry is None:
+                size = POOL_SIZE if user_id == DEFAULT_USER else SHARD_POOL_SIZE
+                entry = self._pools[user_id] = [ConnectionPool(shard_path(user_id), size), now]
+            else:
+                entry[1] = now
+                self._pools.move_to_end(user_id)
+            # Casi siempre O(1): el más antiguo sigue activo y se para ahí
+            self._evict(now, keep=user_id)
+            pending = None
+            if user_id not in self._migrated:
+                pending = self._migrating.setdefault(user_id, threading.Lock())
+
+        pool = entry[0]
+        if pending is not None:
+            with pending:
+                if user_id not in self._migrated:
+                    os.makedirs(os.path.dirname(pool.path) or ".", exist_ok=True)
+                    with pool.connection() as conn:
+                        migrate(conn)
+                    with self._lock:
+                        self._migrated.add(user_id)
+                        self._migrating.pop(user_id, None)
+        return pool
+
+    def _evict(self, now: float, keep: str | None = None) -> None:
+        for user_id, (pool, used) in list(self._pools.items()):
+            if len(self._pools) <= self.max_open and now - used < self.idle:
+                break
+            if user_id == keep or pool.in_use():
+                continue
+            del self._pools[user_id]
+            pool.close()
+
+    def open_count(self) -> int:
+        return len(self._pools)
+
+    def close_all(self) -> None:
+        with self._lock:
+            for pool, _ in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+shards = ShardManager()
+
+
+def get_db():
+    """Conexión del shard del usuario actual: commit al salir, rollback si falla."""
+    return shards.pool().connection()
+
+
+def open_connection() -> sqlite3.Connection:
+    """Conexión fuera del pool y en autocommit, para ATTACH y VACUUM (ver archive.py)."""
+    shards.pool()  # la base del usuario queda creada y migrada
+    conn = _connect(shard_path(current_user.get()))
+    conn.isolation_level = None
+    return conn
+
+
+def open_pool() -> None:
+    shards.pool(DEFAULT_USER).open()
+
+
+def close_pool() -> None:
+    shards.close_all()
+
+
+# Búsqueda de texto (GET /tasks/search): índice FTS5 sobre tasks con contenido externo,
+# sin copiar el texto. remove_diacritics hace que "reunion" encuentre "reunión" y los
+# índices de prefijo de 2 y 3 caracteres sirven la búsqueda mientras se escribe.
+# También lo crean las bases del archivo, con {db} como esquema adjunto.
+FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {db}.tasks_fts USING fts5(
+        title, context,
+        content = 'tasks', content_rowid = 'rowid',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS {db}.trg_fts_insert AFTER INSERT ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (rowid, title, context) VALUES (NEW.rowid, NEW.title, NEW.context);
+    END;
+    CREATE TRIGGER IF NOT EXISTS {db}.trg_fts_delete AFTER DELETE ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, context)
+        VALUES ('delete', OLD.rowid, OLD.title, OLD.context);
+    END;
+    CREATE TRIGGER IF NOT EXISTS {db}.trg_fts_update AFTER UPDATE OF title, context ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, context)
+        VALUES ('delete', OLD.rowid, OLD.title, OLD.context);
+        INSERT INTO tasks_fts (rowid, title, context) VALUES (NEW.rowid, NEW.title, NEW.context);
+    END;
+    -- El título pesa más que el contexto en el orden por relevancia
+    INSERT INTO {db}.tasks_fts (tasks_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)');
+"""
+
+# Migraciones versionadas: (versión, script). Solo se añaden al final, nunca se editan.
+MIGRATIONS = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            context TEXT,
+            priority INTEGER DEFAULT 2,
+            pomodoros INTEGER DEFAULT 1,
+            pomodoros_done INTEGER DEFAULT 0,
+            target_hour TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            done_at DATETIME,
+            date TEXT NOT NULL,
+            position INTEGER DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            score INTEGER,
+            notes TEXT,
+            tasks_done INTEGER,
+            tasks_total INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS user_prefs (
+            key TEXT PRIMARY KEY,
+            value REAL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS task_patterns (
+            task_id             TEXT PRIMARY KEY,
+            date                TEXT NOT NULL,
+            target_hour         TEXT,
+            estimated_pomodoros INTEGER NOT NULL DEFAULT 1,
+            actual_pomodoros    INTEGER NOT NULL DEFAULT 1,
+            was_completed       INTEGER NOT NULL DEFAULT 0,
+            recorded_at         DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_task_patterns_date ON task_patterns(date);
+    """),
+    (2, """
+        -- listar_agenda: filtra por date y ordena sin B-tree temporal
+        CREATE INDEX IF NOT EXISTS idx_tasks_date_order
+            ON tasks(date, position, priority, target_hour);
+        -- conteos de /feedback, obtener_plan y disciplina de prioridades
+        CREATE INDEX IF NOT EXISTS idx_tasks_date_status_priority
+            ON tasks(date, status, priority);
+        -- heurísticas del learner sobre task_patterns
+        CREATE INDEX IF NOT EXISTS idx_task_patterns_date_completed
+            ON task_patterns(date, was_completed, target_hour);
+        DROP INDEX IF EXISTS idx_task_patterns_date;
+    """),
+    (3, """
+        -- caché persistente de respuestas del LLM (ver parse_cache.py)
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key            TEXT PRIMARY KEY,
+            kind           TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            model          TEXT NOT NULL,
+            result         TEXT NOT NULL,
+            created_at     DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_version ON llm_cache(prompt_version);
+    """),
+    (4, """
+        -- Estadísticas diarias mantenidas por triggers: /stats y /feedback no recuentan tasks
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            date              TEXT PRIMARY KEY,
+            tasks_total       INTEGER NOT NULL DEFAULT 0,
+            tasks_done        INTEGER NOT NULL DEFAULT 0,
+            pomodoros_planned INTEGER NOT NULL DEFAULT 0,
+            pomodoros_done    INTEGER NOT NULL DEFAULT 0,
+            feedback_score    INTEGER,
+            updated_at        DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        INSERT OR REPLACE INTO daily_stats
+            (date, tasks_total, tasks_done, pomodoros_planned, pomodoros_done, feedback_score)
+        SELECT t.date, COUNT(*),
+               SUM(t.status = 'done'),
+               COALESCE(SUM(t.pomodoros), 0),
+               COALESCE(SUM(t.pomodoros_done), 0),
+               (SELECT f.score FROM feedback f WHERE f.date = t.date ORDER BY f.id DESC LIMIT 1)
+        FROM tasks t GROUP BY t.date;
+
+        INSERT OR IGNORE INTO daily_stats (date, feedback_score)
+        SELECT f.date, f.score FROM feedback f
+        WHERE f.id = (SELECT MAX(id) FROM feedback WHERE date = f.date);
+
+        CREATE TRIGGER IF NOT EXISTS trg_stats_task_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO daily_stats (date, tasks_total, tasks_done, pomodoros_planned, pomodoros_done)
+            VALUES (NEW.date, 1, NEW.status = 'done',
+                    COALESCE(NEW.pomodoros, 0), COALESCE(NEW.pomodoros_done, 0))
+            ON CONFLICT(date) DO UPDATE SET
+                tasks_total       = tasks_total + 1,
+                tasks_done        = tasks_done + excluded.tasks_done,
+                pomodoros_planned = pomodoros_planned + excluded.pomodoros_planned,
+                pomodoros_done    = pomodoros_done + excluded.pomodoros_done,
+                updated_at        = CURRENT_TIMESTAMP;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_stats_task_delete AFTER DELETE ON tasks
+        BEGIN
+            UPDATE daily_stats SET
+                tasks_total       = tasks_total - 1,
+                tasks_done        = tasks_done - (OLD.status = 'done'),
+                pomodoros_planned = pomodoros_planned - COALESCE(OLD.pomodoros, 0),
+                pomodoros_done    = pomodoros_done - COALESCE(OLD.pomodoros_done, 0),
+                updated_at        = CURRENT_TIMESTAMP
+            WHERE date = OLD.date;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_stats_task_update
+        AFTER UPDATE OF status, pomodoros, pomodoros_done, date ON tasks
+        BEGIN
+            UPDATE daily_stats SET
+                tasks_total       = tasks_total - 1,
+                tasks_done        = tasks_done - (OLD.status = 'done'),
+                pomodoros_planned = pomodoros_planned - COALESCE(OLD.pomodoros, 0),
+                pomodoros_done    = pomodoros_done - COALESCE(OLD.pomodoros_done, 0)
+            WHERE date = OLD.date;
+            INSERT INTO daily_stats (date, tasks_total, tasks_done, pomodoros_planned, pomodoros_done)
+            VALUES (NEW.date, 1, NEW.status = 'done',
+                    COALESCE(NEW.pomodoros, 0), COALESCE(NEW.pomodoros_done, 0))
+            ON CONFLICT(date) DO UPDATE SET
+                tasks_total       = tasks_total + 1,
+                tasks_done        = tasks_done + excluded.tasks_done,
+                pomodoros_planned = pomodoros_planned + excluded.pomodoros_planned,
+                pomodoros_done    = pomodoros_done + excluded.pomodoros_done,
+                updated_at        = CURRENT_TIMESTAMP;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_stats_feedback_insert AFTER INSERT ON feedback
+        BEGIN
+            INSERT INTO daily_stats (date, feedback_score) VALUES (NEW.date, NEW.score)
+            ON CONFLICT(date) DO UPDATE SET
+                feedback_score = excluded.feedback_score,
+                updated_at     = CURRENT_TIMESTAMP;
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_feedback_date ON feedback(date);
+    """),
+    (5, """
+        -- Contadores de versión compartidos entre workers (cachés en memoria)
+        CREATE TABLE IF NOT EXISTS versions (
+            name    TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO versions (name, version) VALUES ('weights', 0);
+
+        CREATE TRIGGER IF NOT EXISTS trg_weights_version_insert AFTER INSERT ON user_prefs
+        BEGIN
+            UPDATE versions SET version = version + 1 WHERE name = 'weights';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_weights_version_update AFTER UPDATE ON user_prefs
+        BEGIN
+            UPDATE versions SET version = version + 1 WHERE name = 'weights';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_weights_version_delete AFTER DELETE ON user_prefs
+        BEGIN
+            UPDATE versions SET version = version + 1 WHERE name = 'weights';
+        END;
+    """),
+    (6, """
+        -- Versión por día de tasks: base de los ETag y de la caché de planes
+        CREATE TABLE IF NOT EXISTS day_versions (
+            date    TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO day_versions (date, version)
+        SELECT date, 1 FROM tasks GROUP BY date;
+
+        -- Identifica esta base de datos: si se recrea, los ETag antiguos no coinciden
+        INSERT OR IGNORE INTO versions (name, version) VALUES ('epoch', abs(random()));
+
+        CREATE TRIGGER IF NOT EXISTS trg_day_version_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO day_versions (date, version) VALUES (NEW.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_day_version_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT INTO day_versions (date, version) VALUES (OLD.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_day_version_update AFTER UPDATE ON tasks
+        BEGIN
+            INSERT INTO day_versions (date, version) VALUES (OLD.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+            INSERT INTO day_versions (date, version) SELECT NEW.date, 1 WHERE NEW.date IS NOT OLD.date
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END;
+    """),
+    (7, """
+        -- Registro de cambios para sincronización delta (GET /changes?since=).
+        -- Una fila por (tarea, día): cada cambio la reemplaza con un seq nuevo,
+        -- así el registro no crece con cada edición y el cursor es un rango del PK.
+        CREATE TABLE IF NOT EXISTS task_changes (
+            seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL,
+            date    TEXT NOT NULL,
+            op      TEXT NOT NULL,
+            UNIQUE (task_id, date)
+        );
+        CREATE INDEX IF NOT EXISTS idx_task_changes_date_seq ON task_changes(date, seq);
+
+        CREATE TRIGGER IF NOT EXISTS trg_changes_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT OR REPLACE INTO task_changes (task_id, date, op) VALUES (NEW.id, NEW.date, 'insert');
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_changes_update AFTER UPDATE ON tasks
+        BEGIN
+            INSERT OR REPLACE INTO task_changes (task_id, date, op) VALUES (NEW.id, NEW.date, 'update');
+            -- Si cambia de día, el día anterior también lo registra (lápida allí)
+            INSERT OR REPLACE INTO task_changes (task_id, date, op)
+            SELECT OLD.id, OLD.date, 'move' WHERE NEW.date IS NOT OLD.date;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_changes_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT OR REPLACE INTO task_changes (task_id, date, op) VALUES (OLD.id, OLD.date, 'delete');
+        END;
+    """),
+    (8, """
+        -- Cola de trabajos de aprendizaje (ver jobs.py)
+        CREATE TABLE IF NOT EXISTS jobs (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind         TEXT NOT NULL,
+            dedupe_key   TEXT UNIQUE,
+            payload      TEXT NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'pending',
+            attempts     INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after    REAL NOT NULL DEFAULT 0,
+            result       TEXT,
+            error        TEXT,
+            created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after);
+    """),
+    (9, """
+        -- GET /agenda?from=&to=: paginación por clave (date, position, id) sin B-tree temporal
+        CREATE INDEX IF NOT EXISTS idx_tasks_date_position_id ON tasks(date, position, id);
+    """),
+    (10, """
+        -- Meses con tareas movidas al archivo frío (ver archive.py)
+        CREATE TABLE IF NOT EXISTS archived_months (
+            month       TEXT PRIMARY KEY,
+            tasks       INTEGER NOT NULL DEFAULT 0,
+            patterns    INTEGER NOT NULL DEFAULT 0,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (11, FTS_SCHEMA.format(db="main") + """
+        INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+    """),
+]
+
+
+def schema_version(conn) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version    INTEGER PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) AS v FROM schema_version").fetchone()
+    return row["v"] or 0
+
+
+def migrate(conn) -> int:
+    """Aplica las migraciones pendientes, cada una en su propia transacción."""
+    current = schema_version(conn)
+    conn.commit()
+    for version, script in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.executescript(
+            f"BEGIN;\n{script}\n"
+            f"INSERT INTO schema_version (version) VALUES ({version});\nCOMMIT;"
+        )
+        current = version
+    conn.execute("PRAGMA optimize")
+    return current
+
+
 def init_db():
     with get_db() as conn:
-        conn.executescript("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                context TEXT,
-                priority INTEGER DEFAULT 2,
-                pomodoros INTEGER DEFAULT 1,
-                pomodoros_done INTEGER DEFAULT 0,
-                target_hour TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                done_at DATETIME,
-                date TEXT NOT NULL,
-                position INTEGER DEFAULT 0
-            );
-
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                score INTEGER,
-                notes TEXT,
-                tasks_done INTEGER,
-                tasks_total INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS user_prefs (
-                key TEXT PRIMARY KEY,
-                value REAL,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS task_patterns (
-                task_id             TEXT PRIMARY KEY,
-                date                TEXT NOT NULL,
-                target_hour         TEXT,
-                estimated_pomodoros INTEGER NOT NULL DEFAULT 1,
-                actual_pomodoros    INTEGER NOT NULL DEFAULT 1,
-                was_completed       INTEGER NOT NULL DEFAULT 0,
-                recorded_at         DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks(id)
-            );
-            CREATE INDEX IF NOT EXISTS idx_task_patterns_date ON task_patterns(date);
-        """)
-
-# Llamar a init_db al importar este módulo por primera vez
-init_db()
\ No newline at end of file
+        migrate(conn)
+
+
+def day_versions(conn, desde: str, hasta: str | None = None) -> tuple:
+    """Versiones de los días [desde, hasta] como tupla (sirve de clave de caché)."""
+    rows = conn.execute(
+        "SELECT date, version FROM day_versions WHERE date BETWEEN ? AND ? ORDER BY date",
+        (desde, hasta or desde),
+    ).fetchall()
+    return tuple((r["date"], r["version"]) for r in rows)
+
+
+def db_epoch(conn) -> int:
+    row = conn.execute("SELECT version FROM versions WHERE name = 'epoch'").fetchone()
+    return row["version"] if row else 0
+
+
+# Consultas calientes: ninguna debe recorrer una tabla completa ni ordenar en temporal.
+# El SQL es el mismo que ejecutan los handlers (queries.py); aquí solo van parámetros de ejemplo
+_DAY = ("2026-01-01",)
+HOT_QUERIES = {
+    "listar_agenda": (queries.AGENDA_DAY, _DAY),
+    "obtener_plan": (queries.PLAN_DAY, _DAY),
+    "plan_range": (queries.PLAN_RANGE, ("2026-01-01", "2026-01-07")),
+    "agenda_range": (
+        queries.agenda_range(["*"], after=True),
+        ("2026-01-01", "2026-12-31", "2026-03-01", 0, "", 200),
+    ),
+    "agenda_range_filtered": (
+        queries.agenda_range(["*"], statuses=2, priorities=1),
+        ("2026-01-01", "2026-12-31", "pending", "postponed", 1, 200),
+    ),
+    "search_window": (queries.SEARCH_WINDOW, ('"reunion"*', "0000-01-01", "9999-12-31", 1000)),
+    "search_ranked": (
+        queries.SEARCH_RANKED, ('"reunion"*', 1, 1000, "0000-01-01", "9999-12-31", 20),
+    ),
+    "feedback_last": (queries.FEEDBACK_LAST, _DAY),
+    "day_stats": (queries.DAY_STATS, _DAY),
+    "stats_range": (queries.STATS_RANGE, ("2026-01-01", "2026-01-07")),
+    "changes_head": (queries.CHANGES_HEAD, ()),
+    "changes_since": (queries.CHANGES_SINCE, (0, 500)),
+    "changes_since_date": (queries.CHANGES_SINCE_DATE, ("2026-01-01", 0, 500)),
+    "claim_job": (queries.CLAIM_JOB, (0,)),
+    "archived_months": (queries.ARCHIVED_MONTHS, ("2026-01", "2026-12")),
+    "morning_completion": (queries.MORNING_COMPLETION, _DAY),
+    "pomodoro_accuracy": (queries.POMODORO_ACCURACY, _DAY),
+    "priority_p1_skip": (queries.P1_SKIP, _DAY),
+    "priority_p3_done": (queries.P3_DONE, _DAY),
+    "first_completed_hour": (queries.FIRST_COMPLETED_HOUR, _DAY),
+}
+
+
+def check_query_plans(conn) -> list[str]:
+    """Devuelve las consultas calientes cuyo plan hace SCAN o usa un B-tree temporal."""
+    failures = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        for row in plan:
+            detail = row["detail"]
+            # Un SCAN de tabla FTS5 con MATCH (":M") recorre el índice invertido, no la tabla
+            fts = "VIRTUAL TABLE INDEX" in detail and ":M" in detail
+            if (detail.startswith("SCAN ") and not fts) or "TEMP B-TREE" in detail:
+                failures.append(f"{name}: {detail}")
+    return failures
+
+
+if __name__ == "__main__":
+    # python database.py --check-plans  → sale con código 1 si alguna consulta regresa
+    import sys
+
+    if "--check-plans" in sys.argv:
+        check_conn = _connect(":memory:")
+        migrate(check_conn)
+        failures = check_query_plans(check_conn)
+        for f in failures:
+            print(f"REGRESIÓN: {f}")
+        print(f"{len(HOT_QUERIES) - len({f.split(':')[0] for f in failures})}/{len(HOT_QUERIES)} consultas OK")
+        sys.exit(1 if failures else 0)
+    init_db()
@@ -0,0 +1,220 @@
+"""Canal de eventos SSE por día (GET /agenda/{fecha}/events).
+
+Un único bombeo lee task_changes y el contador de pesos del shard de cada usuario
+con suscriptores y reparte los eventos a los suscriptores de cada día. Cada mensaje se formatea una sola vez y se
+comparte entre todas las colas, así que un suscriptor inactivo solo cuesta su
+cola acotada. Si un cliente lento llena la cola, se vacía y recibe un único
+evento `resync` con el último seq que llegó a leer, para que se ponga al día con
+GET /changes desde ahí.
+"""
+import asyncio
+import json
+import os
+
+import queries
+from database import current_user, get_db, use_user
+
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "64"))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))    # segundos
+SSE_POLL = float(os.getenv("SSE_POLL", "1.0"))              # cambios de otros procesos
+SSE_BATCH = 1000
+
+
+def format_event(event: str, data: dict, event_id: int | None = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+HEARTBEAT = ": ping\n\n"
+
+
+class Subscriber:
+    __slots__ = ("user", "fecha", "queue", "overflowed", "delivered")
+
+    def __init__(self, user: str, fecha: str, since: int = 0):
+        self.user = user
+        self.fecha = fecha
+        self.queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.overflowed = False
+        self.delivered = since     # seq del último mensaje que el cliente recibió
+
+    def offer(self, message: str, cursor: int) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((cursor, message))
+        except asyncio.QueueFull:
+            # Contrapresión: se descarta lo pendiente y el cliente resincroniza desde lo
+            # último que recibió, no desde lo que se descarta
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((self.delivered, format_event("resync", {"cursor": self.delivered})))
+            self.overflowed = True
+
+    async def next(self) -> str:
+        try:
+            cursor, message = await asyncio.wait_for(self.queue.get(), SSE_HEARTBEAT)
+        except asyncio.TimeoutError:
+            return HEARTBEAT
+        self.delivered = max(self.delivered, cursor)
+        if self.queue.empty():
+            self.overflowed = False
+        return message
+
+
+class EventHub:
+    def __init__(self):
+        # usuario -> día -> suscriptores; usuario -> [cursor de task_changes, versión de pesos]
+        self.channels: dict[str, dict[str, set[Subscriber]]] = {}
+        self.heads: dict[str, list] = {}
+        self._wake: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    # --- ciclo de vida (lifespan de la app) ---
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._pump())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def notify(self) -> None:
+        """Despierta el bombeo tras un commit. Se puede llamar desde cualquier hilo."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- suscripciones ---
+
+    async def subscribe(self, fecha: str) -> Subscriber:
+        """Suscribe al usuario actual al día. El primero de un usuario fija su cursor."""
+        user = current_user.get()
+        if user not in self.heads:
+            head = list(await asyncio.to_thread(self._head, user))
+            # Otro suscriptor del mismo usuario pudo fijarlo mientras tanto
+            self.heads.setdefault(user, head)
+        # Se registra después del await: si el cliente se va durante la lectura, no queda nada
+        sub = Subscriber(user, fecha, self.heads[user][0])
+        self.channels.setdefault(user, {}).setdefault(fecha, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        days = self.channels.get(sub.user, {})
+        subs = days.get(sub.fecha)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del days[sub.fecha]
+        if not days:
+            # Sin suscriptores no se lee su shard; el próximo parte de la cabeza de entonces
+            self.channels.pop(sub.user, None)
+            self.heads.pop(sub.user, None)
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for days in self.channels.values() for s in days.values())
+
+    # --- bombeo ---
+
+    async def _pump(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), SSE_POLL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            for user, head in list(self.heads.items()):
+                if user not in self.channels:
+                    # Cabeza leída para una suscripción que no llegó a registrarse
+                    self.heads.pop(user, None)
+                    continue
+                rows, tasks, weights = await asyncio.to_thread(self._read, user, head[0])
+                if self.heads.get(user) is head:   # sigue suscrito
+                    self._dispatch(user, head, rows, tasks, weights)
+
+    def _head(self, user: str) -> tuple[int, int]:
+        from learner import weights_version
+        with use_user(user), get_db() as conn:
+            head = conn.execute(queries.CHANGES_HEAD).fetchone()[0]
+            return head, weights_version(conn)
+
+    def _read(self, user: str, since: int):
+        from learner import weights_version
+        with use_user(user), get_db() as conn:
+            rows = [dict(r) for r in conn.execute(queries.CHANGES_SINCE, (since, SSE_BATCH))]
+            tasks = _load_tasks(conn, {r["task_id"] for r in rows})
+            return rows, tasks, weights_version(conn)
+
+    def _dispatch(self, user: str, head: list, rows: list[dict], tasks: dict, weights: int) -> None:
+        channels = self.channels.get(user, {})
+        invalidated: dict[str, int] = {}
+        for r in rows:
+            head[0] = r["seq"]
+            subs = channels.get(r["date"])
+            if not subs:
+                continue
+            message = task_event(r, tasks.get(r["task_id"]))
+            for sub in subs:
+                sub.offer(message, r["seq"])
+            invalidated[r["date"]] = r["seq"]
+
+        if weights != head[1]:
+            head[1] = weights
+            message = format_event("weights-changed", {"version": weights})
+            for fecha, subs in channels.items():
+                for sub in subs:
+                    sub.offer(message, head[0])
+                invalidated.setdefault(fecha, head[0])
+
+        # Un solo plan-invalidated por día y lote, aunque cambien muchas tareas
+        for fecha, seq in invalidated.items():
+            message = format_event("plan-invalidated", {"date": fecha})
+            for sub in channels.get(fecha, ()):
+                sub.offer(message, seq)
+
+        if len(rows) == SSE_BATCH:
+            self._wake.set()
+
+
+def task_event(row: dict, task: dict | None) -> str:
+    """Evento task-changed para el canal del día `row["date"]`."""
+    deleted = task is None or task["status"] == "cancelled" or task["date"] != row["date"]
+    return format_event("task-changed", {
+        "id": row["task_id"],
+        "date": row["date"],
+        "op": row["op"],
+        "deleted": deleted,
+        "task": None if deleted else task,
+    }, row["seq"])
+
+
+def replay(fecha: str, since: int) -> list[str]:
+    """Eventos del día posteriores a `since` (cabecera Last-Event-ID al reconectar)."""
+    with get_db() as conn:
+        rows = [dict(r) for r in conn.execute(
+            queries.CHANGES_SINCE_DATE, (fecha, since, SSE_BATCH))]
+        tasks = _load_tasks(conn, {r["task_id"] for r in rows})
+    if len(rows) == SSE_BATCH:
+        return [format_event("resync", {"cursor": since})]
+    return [task_event(r, tasks.get(r["task_id"])) for r in rows]
+
+
+def _load_tasks(conn, ids: set) -> dict:
+    if not ids:
+        return {}
+    ids = list(ids)
+    placeholders = ", ".join("?" * len(ids))
+    cursor = conn.execute(f"SELECT * FROM tasks WHERE id IN ({placeholders})", ids)
+    return {t["id"]: dict(t) for t in cursor.fetchall()}
+
+
+hub = EventHub()
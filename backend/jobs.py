@@ -0,0 +1,213 @@
+"""Cola de trabajos persistente en SQLite para el aprendizaje fuera de la petición.
+
+Los trabajos se encolan con `enqueue` en la misma transacción que la escritura que
+los origina: si esa escritura se revierte, el trabajo tampoco existe. Un pool de
+hilos los reclama de uno en uno y ejecuta el manejador y el cierre del trabajo en
+una sola transacción, así que un fallo a mitad no deja efectos parciales y el
+reintento es seguro. `dedupe_key` hace idempotente el encolado.
+
+Cada usuario tiene su tabla jobs en su shard. Los workers solo miran los shards
+marcados con `notify` (o con reintentos pendientes), no todos los usuarios.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import queries
+from database import current_user, get_db, shard_users, use_user
+
+# SQLite serializa las escrituras y el aprendizaje depende del orden (outcomes antes que
+# el feedback del día), así que por defecto hay un solo worker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL = float(os.getenv("JOB_POLL", "1.0"))          # segundos entre sondeos sin aviso
+JOB_BACKOFF = float(os.getenv("JOB_BACKOFF", "2.0"))    # base del reintento exponencial
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+log = logging.getLogger("agenda.jobs")
+
+
+# --- Manejadores: reciben el payload y la conexión de la transacción del trabajo ---
+
+def _task_outcome(payload: dict, conn) -> dict:
+    from learner import record_task_outcome
+    record_task_outcome(payload["task_id"], was_completed=True,
+                        actual_pomodoros=payload["actual_pomodoros"], conn=conn)
+    return {"task_id": payload["task_id"]}
+
+
+def _feedback(payload: dict, conn) -> dict:
+    from learner import process_feedback
+    return process_feedback(payload["date"], payload["score"], payload.get("notes"), conn=conn)
+
+
+HANDLERS = {
+    "task_outcome": _task_outcome,
+    "feedback": _feedback,
+}
+
+
+def enqueue(conn, kind: str, payload: dict, dedupe_key: str | None = None) -> int:
+    """Encola un trabajo en la transacción de `conn` y devuelve su id.
+
+    Con la misma dedupe_key se reutiliza el trabajo: si aún no ha empezado se
+    actualiza su payload y, si ya terminó, se vuelve a poner en cola.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"tipo de trabajo desconocido: {kind}")
+    row = conn.execute("""
+        INSERT INTO jobs (kind, dedupe_key, payload, max_attempts)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(dedupe_key) DO UPDATE SET
+            payload = excluded.payload,
+            status = 'pending',
+            attempts = 0,
+            run_after = 0,
+            result = NULL,
+            error = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE jobs.status != 'running'
+        RETURNING id
+    """, (kind, dedupe_key, json.dumps(payload), JOB_MAX_ATTEMPTS)).fetchone()
+    if row is None:
+        # En ejecución ahora mismo: el trabajo existente sigue siendo el de referencia
+        row = conn.execute("SELECT id FROM jobs WHERE dedupe_key = ?", (dedupe_key,)).fetchone()
+    return row["id"]
+
+
+def get_job(job_id: int) -> dict | None:
+    with get_db() as conn:
+        row = conn.execute("""
+            SELECT id, kind, status, attempts, max_attempts, result, error, created_at, updated_at
+            FROM jobs WHERE id = ?
+        """, (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+# --- Workers ---
+
+_wake = threading.Event()
+_stop = threading.Event()
+_threads: list[threading.Thread] = []
+
+# Usuarios cuyo shard puede tener trabajos listos
+_pending_users: set[str] = set()
+_users_lock = threading.Lock()
+
+
+def notify(user_id: str | None = None) -> None:
+    """Avisa a los workers de que el usuario (el actual por defecto) tiene trabajo confirmado."""
+    with _users_lock:
+        _pending_users.add(user_id or current_user.get())
+    _wake.set()
+
+
+def start(workers: int = JOB_WORKERS) -> None:
+    for user in shard_users():
+        with use_user(user), get_db() as conn:
+            # Lo que quedó a medias en un apagado brusco vuelve a la cola
+            conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+            conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated_at < datetime('now', ?)",
+                (f"-{JOB_RETENTION_DAYS} days",),
+            )
+        with _users_lock:
+            _pending_users.add(user)
+    _stop.clear()
+    for i in range(workers):
+        t = threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+    notify()
+
+
+def stop(timeout: float = 5.0) -> None:
+    _stop.set()
+    _wake.set()
+    for t in _threads:
+        t.join(timeout)
+    _threads.clear()
+
+
+def run_pending() -> int:
+    """Procesa en este hilo todo lo que esté listo. Devuelve cuántos trabajos ejecutó."""
+    with _users_lock:
+        _pending_users.add(current_user.get())
+    count = 0
+    while (job := _claim()) is not None:
+        _run(job)
+        count += 1
+    return count
+
+
+def _worker() -> None:
+    while not _stop.is_set():
+        try:
+            job = _claim()
+        except Exception:
+            # Un shard bloqueado o ilegible no debe matar al worker de todos los usuarios
+            log.exception("no se pudo reclamar trabajo")
+            job = None
+        if job is None:
+            _wake.wait(JOB_POLL)
+            _wake.clear()
+            continue
+        _run(job)
+
+
+def _claim() -> dict | None:
+    with _users_lock:
+        users = list(_pending_users)
+    for user in users:
+        with use_user(user):
+            job, waiting = _claim_in_shard()
+        if job is not None:
+            return job | {"user": user}
+        if not waiting:
+            with _users_lock:
+                _pending_users.discard(user)
+    return None
+
+
+def _claim_in_shard() -> tuple[dict | None, bool]:
+    """(trabajo reclamado, si quedan pendientes con reintento aplazado)."""
+    with get_db() as conn:
+        row = conn.execute(queries.CLAIM_JOB, (time.time(),)).fetchone()
+        if row is not None:
+            return dict(row), True
+        waiting = conn.execute("SELECT 1 FROM jobs WHERE status = 'pending' LIMIT 1").fetchone()
+    return None, waiting is not None
+
+
+def _run(job: dict) -> None:
+    with use_user(job["user"]):
+        _run_in_shard(job)
+
+
+def _run_in_shard(job: dict) -> None:
+    try:
+        with get_db() as conn:
+            result = HANDLERS[job["kind"]](json.loads(job["payload"]), conn)
+            conn.execute("""
+                UPDATE jobs SET status = 'done', result = ?, error = NULL,
+                                updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (json.dumps(result), job["id"]))
+    except Exception as e:
+        failed = job["attempts"] >= job["max_attempts"]
+        log.warning("trabajo %s (%s) de %s falló, intento %s: %r",
+                    job["id"], job["kind"], job["user"], job["attempts"], e)
+        with get_db() as conn:
+            conn.execute("""
+                UPDATE jobs SET status = ?, run_after = ?, error = ?,
+                                updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, ("failed" if failed else "pending",
+                  time.time() + JOB_BACKOFF ** job["attempts"],
+                  repr(e), job["id"]))
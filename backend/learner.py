@@ -1,4 +1,8 @@
-from database import get_db
+import threading
+from contextlib import contextmanager
+import queries
+from database import current_user, get_db
+from metrics import timed
 
 DEFAULT_WEIGHTS = {
     "morning_weight": 1.0,
@@ -7,17 +11,84 @@ DEFAULT_WEIGHTS = {
     "preferred_start_hour": 9.0,
 }
 
+# Umbrales y pasos de las heurísticas. replay.py los reutiliza y permite probar otros
+PARAMS = {
+    "min_samples": 2,            # tareas mínimas de mañana y de tarde para comparar
+    "morning_margin": 0.2,       # diferencia de tasa de completado que mueve el peso
+    "morning_step": 0.05,
+    "ratio_high": 1.2,           # pomodoros reales / estimados
+    "ratio_low": 0.8,
+    "pomodoro_step": 0.05,
+    "priority_step": 0.1,
+    "weight_min": 0.5,
+    "weight_max": 2.0,
+    "low_score": 3,              # por debajo, se revisa la hora de inicio
+    "start_hour_min": 6.0,
+    "start_hour_step": 0.5,
+}
+
+
+@contextmanager
+def _use_conn(conn):
+    # Reutiliza la conexión del llamador si la hay; si no, toma una del pool
+    if conn is not None:
+        yield conn
+    else:
+        with get_db() as own:
+            yield own
+
+
+# Instantánea en memoria de los pesos de cada usuario: usuario -> (versión en su shard, pesos)
+_weights_snapshots: dict[str, tuple[int, dict]] = {}
+_snapshot_lock = threading.Lock()
+
+
+def weights_version(conn) -> int:
+    row = conn.execute("SELECT version FROM versions WHERE name = 'weights'").fetchone()
+    return row["version"] if row else 0
+
+
+@timed("learner_seconds", fn="get_planner_weights")
+def get_planner_weights(conn=None) -> dict:
+    """Pesos del planner del usuario actual. En estado estable solo lee el contador de versión."""
+    user = current_user.get()
+    with _use_conn(conn) as conn:
+        # La versión se lee antes que los pesos: en una carrera se recarga de más, nunca de menos
+        version = weights_version(conn)
+        snapshot = _weights_snapshots.get(user)
+        if snapshot is not None and snapshot[0] == version:
+            return dict(snapshot[1])
 
-def get_planner_weights() -> dict:
-    with get_db() as conn:
         result = dict(DEFAULT_WEIGHTS)
-        for key in DEFAULT_WEIGHTS:
-            result[key] = _get_weight(key, conn)
-        return result
+        placeholders = ", ".join("?" * len(DEFAULT_WEIGHTS))
+        for row in conn.execute(
+            f"SELECT key, value FROM user_prefs WHERE key IN ({placeholders})",
+            list(DEFAULT_WEIGHTS),
+        ):
+            result[row["key"]] = row["value"]
+
+        # Con escrituras propias sin confirmar, lo leído podría revertirse: no se cachea
+        if not conn.in_transaction:
+            with _snapshot_lock:
+                _weights_snapshots[user] = (version, result)
+        return dict(result)
+
+
+def invalidate_weights() -> None:
+    with _snapshot_lock:
+        _weights_snapshots.pop(current_user.get(), None)
 
 
-def record_task_outcome(task_id: str, was_completed: bool, actual_pomodoros: int) -> None:
-    with get_db() as conn:
+def save_weights(weights: dict, conn=None) -> None:
+    """Sustituye los pesos aprendidos (p. ej. por los recalculados en replay.py)."""
+    with _use_conn(conn) as conn:
+        for key, value in weights.items():
+            _upsert_weight(key, value, conn)
+
+
+@timed("learner_seconds", fn="record_task_outcome")
+def record_task_outcome(task_id: str, was_completed: bool, actual_pomodoros: int, conn=None) -> None:
+    with _use_conn(conn) as conn:
         cursor = conn.execute(
             "SELECT target_hour, pomodoros, date FROM tasks WHERE id = ?", (task_id,)
         )
@@ -30,12 +101,12 @@ def record_task_outcome(task_id: str, was_completed: bool, actual_pomodoros: int
             VALUES (?, ?, ?, ?, ?, ?)
         """, (task_id, row["date"], row["target_hour"],
               row["pomodoros"], actual_pomodoros, 1 if was_completed else 0))
-        conn.commit()
 
 
-def process_feedback(date: str, score: int, notes: str | None) -> dict:
+@timed("learner_seconds", fn="process_feedback")
+def process_feedback(date: str, score: int, notes: str | None, conn=None) -> dict:
     changes = {}
-    with get_db() as conn:
+    with _use_conn(conn) as conn:
         for fn, key in [
             (_analyze_morning_completion, "morning_weight"),
             (_analyze_pomodoro_accuracy, "pomodoro_accuracy"),
@@ -44,84 +115,62 @@ def process_feedback(date: str, score: int, notes: str | None) -> dict:
             delta = fn(date, conn)
             if delta is not None:
                 old = _get_weight(key, conn)
-                new = max(0.5, min(2.0, old + delta))
+                new = max(PARAMS["weight_min"], min(PARAMS["weight_max"], old + delta))
                 _upsert_weight(key, new, conn)
                 changes[key] = {"old": old, "new": new}
 
-        if score < 3:
-            cursor = conn.execute("""
-                SELECT target_hour FROM task_patterns
-                WHERE date = ? AND was_completed = 1
-                ORDER BY target_hour ASC LIMIT 1
-            """, (date,))
+        if score < PARAMS["low_score"]:
+            cursor = conn.execute(queries.FIRST_COMPLETED_HOUR, (date,))
             row = cursor.fetchone()
             if row and row["target_hour"]:
                 first_hour = int(row["target_hour"].split(":")[0])
                 current = int(_get_weight("preferred_start_hour", conn))
                 if first_hour > current + 1:
-                    new = max(6.0, current - 0.5)
+                    new = max(PARAMS["start_hour_min"], current - PARAMS["start_hour_step"])
                     _upsert_weight("preferred_start_hour", new, conn)
                     changes["preferred_start_hour"] = {"old": current, "new": new}
-
-        conn.commit()
     return {"date": date, "score": score, "weight_changes": changes}
 
 
 # --- Heurísticas privadas ---
 
 def _analyze_morning_completion(date, conn):
-    cur = conn.execute("""
-        SELECT
-            SUM(CASE WHEN target_hour < '12:00' AND was_completed=1 THEN 1 ELSE 0 END) m_done,
-            SUM(CASE WHEN target_hour < '12:00' THEN 1 ELSE 0 END) m_total,
-            SUM(CASE WHEN target_hour >= '12:00' AND was_completed=1 THEN 1 ELSE 0 END) a_done,
-            SUM(CASE WHEN target_hour >= '12:00' THEN 1 ELSE 0 END) a_total
-        FROM task_patterns WHERE date=?
-    """, (date,))
+    cur = conn.execute(queries.MORNING_COMPLETION, (date,))
     r = cur.fetchone()
-    if not r or not r["m_total"] or r["m_total"] < 2 or not r["a_total"] or r["a_total"] < 2:
+    if not r or not r["m_total"] or r["m_total"] < PARAMS["min_samples"] \
+            or not r["a_total"] or r["a_total"] < PARAMS["min_samples"]:
         return None
     diff = (r["m_done"] / r["m_total"]) - (r["a_done"] / r["a_total"])
-    if diff > 0.2:
-        return +0.05
-    if diff < -0.2:
-        return -0.05
+    if diff > PARAMS["morning_margin"]:
+        return +PARAMS["morning_step"]
+    if diff < -PARAMS["morning_margin"]:
+        return -PARAMS["morning_step"]
     return None
 
 
 def _analyze_pomodoro_accuracy(date, conn):
-    cur = conn.execute("""
-        SELECT AVG(CAST(actual_pomodoros AS REAL) / estimated_pomodoros) ratio
-        FROM task_patterns WHERE date=? AND was_completed=1 AND estimated_pomodoros>0
-    """, (date,))
+    cur = conn.execute(queries.POMODORO_ACCURACY, (date,))
     r = cur.fetchone()
     if not r or r["ratio"] is None:
         return None
-    if r["ratio"] > 1.2:
-        return +0.05
-    if r["ratio"] < 0.8:
-        return -0.05
+    if r["ratio"] > PARAMS["ratio_high"]:
+        return +PARAMS["pomodoro_step"]
+    if r["ratio"] < PARAMS["ratio_low"]:
+        return -PARAMS["pomodoro_step"]
     return None
 
 
 def _analyze_priority_discipline(date, conn):
     # Urgentes que quedaron pendientes (no aparecen en task_patterns)
-    cur = conn.execute("""
-        SELECT COUNT(*) p1_skip FROM tasks
-        WHERE date=? AND priority=1 AND status != 'done'
-    """, (date,))
+    cur = conn.execute(queries.P1_SKIP, (date,))
     p1_skip = cur.fetchone()["p1_skip"]
 
     # Opcionales completadas (sí aparecen en task_patterns)
-    cur = conn.execute("""
-        SELECT COUNT(*) p3_done FROM task_patterns tp
-        JOIN tasks t ON t.id=tp.task_id
-        WHERE tp.date=? AND t.priority=3 AND tp.was_completed=1
-    """, (date,))
+    cur = conn.execute(queries.P3_DONE, (date,))
     p3_done = cur.fetchone()["p3_done"]
 
     if p1_skip > 0 and p3_done > 0:
-        return +0.1
+        return +PARAMS["priority_step"]
     return None
 
 
@@ -132,6 +181,9 @@ def _get_weight(key: str, conn) -> float:
 
 
 def _upsert_weight(key: str, value: float, conn) -> None:
+    # El trigger sobre user_prefs sube la versión en la misma transacción;
+    # la instantánea local se descarta para no servir pesos sin confirmar
+    invalidate_weights()
     conn.execute("""
         INSERT INTO user_prefs (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
         ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=CURRENT_TIMESTAMP
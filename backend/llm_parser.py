@@ -1,15 +1,43 @@
+import asyncio
+import copy
+import difflib
+import hashlib
 import json
+import logging
 import os
+import re
 from dotenv import load_dotenv
-from groq import Groq
 
 load_dotenv()
 
-# Configurar Groq como primario (Google no disponible en Bolivia)
-client = Groq(api_key=os.getenv("groq_api_key"))
+import metrics
+import parse_cache
+from local_parser import parse_local
+from providers import build_router
 
-def parse_task(user_input: str) -> dict:
-    prompt = f"""
+log = logging.getLogger("agenda.llm")
+
+MODEL = "llama-3.3-70b-versatile"
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))     # llamadas simultáneas a Groq
+
+# "hybrid": parser local primero y LLM solo si la confianza es baja
+# "local": nunca llama al LLM | "llm": siempre llama al LLM
+PARSER_MODES = ("hybrid", "local", "llm")
+PARSER_MODE = os.getenv("PARSER_MODE", "hybrid")
+LOCAL_CONFIDENCE = float(os.getenv("LOCAL_CONFIDENCE", "0.65"))
+
+# Textos de día largos se parten en trozos que se parsean en paralelo
+DAY_CHUNK_CHARS = int(os.getenv("DAY_CHUNK_CHARS", "1200"))
+DAY_FANOUT = int(os.getenv("DAY_FANOUT", "4"))             # trozos simultáneos por petición
+DEDUP_RATIO = float(os.getenv("DEDUP_RATIO", "0.88"))     # similitud de títulos duplicados
+
+# Groq como primario (Google no disponible en Bolivia); orden de failover en LLM_PROVIDERS
+router = build_router(MODEL)
+
+_llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+_inflight: dict[str, asyncio.Task] = {}
+
+TASK_PROMPT = """
 Parsea la siguiente tarea en lenguaje natural a JSON con este esquema exacto:
 {{
   "title": "título corto y claro (máx 60 caracteres)",
@@ -23,26 +51,46 @@ Tarea: "{user_input}"
 
 Responde SOLO con el JSON, sin texto adicional, sin markdown.
 """
-    
-    try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-        )
-        texto = response.choices[0].message.content.strip()
-        return _parse_json_response(texto, user_input)
-    except Exception as e:
-        print(f"Error con Groq: {e}")
-        
-    # Último fallback: respuesta por defecto
-    return {
-        "title": user_input,
-        "priority": 2,
-        "pomodoros": 1,
-        "target_hour": None,
-        "context": None
-    }
+
+DAY_PROMPT = """Eres un asistente de planificación. El usuario describe su día.
+Extrae TODAS las tareas y devuelve un array JSON.
+
+Reglas:
+- Cada tarea = un objeto separado
+- target_hour: hora exacta "HH:MM" | tiempo relativo → "mañana temprano"→"08:00", "mediodía"→"12:00", "tarde"→"16:00", "noche"→"20:00" | null si no hay hora
+- priority: 1=urgente ("urgente","crítico","sí o sí"), 2=importante (reuniones,entregas), 3=opcional ("si da tiempo","cuando pueda")
+- pomodoros: 1=llamada corta, 2=tarea media, 3=concentración extendida, 4=proyecto grande
+- context: detalle relevante o null
+- title: máx 60 chars, claro y concreto
+
+Esquema de cada objeto:
+{{"title":"string","priority":1|2|3,"pomodoros":1|2|3|4,"target_hour":"HH:MM"|null,"context":"string"|null}}
+
+Texto: "{texto}"
+
+Responde SOLO con el array JSON, sin markdown:"""
+
+# Cambia automáticamente al editar cualquier plantilla, invalidando la caché anterior
+PROMPT_VERSION = hashlib.sha256((TASK_PROMPT + DAY_PROMPT).encode("utf-8")).hexdigest()[:12]
+
+
+def _cache_model() -> str:
+    # Solo se guardan respuestas del primario: las del failover o del stub no deben
+    # servirse como suyas cuando vuelva
+    primary = router.primary
+    return primary.cache_id if primary else MODEL
+
+
+def _try_local(user_input: str, mode: str | None) -> dict | None:
+    mode = mode or PARSER_MODE
+    if mode == "llm":
+        return None
+    result, confidence = parse_local(user_input)
+    if mode == "local" or confidence >= LOCAL_CONFIDENCE:
+        metrics.inc("parser_local_total", mode=mode)
+        return result
+    return None
+
 
 def _clean_json_array(texto: str) -> list:
     """Limpia la respuesta LLM y garantiza una lista Python."""
@@ -57,46 +105,303 @@ def _clean_json_array(texto: str) -> list:
     return data if isinstance(data, list) else [data]
 
 
-def parse_day(texto: str) -> list[dict]:
-    """Extrae TODAS las tareas de un texto de día en lenguaje natural. 1 llamada LLM."""
-    prompt = f"""Eres un asistente de planificación. El usuario describe su día.
-Extrae TODAS las tareas y devuelve un array JSON.
+# --- Parseo asíncrono: no ocupa hilos del threadpool mientras espera al LLM ---
 
-Reglas:
-- Cada tarea = un objeto separado
-- target_hour: hora exacta "HH:MM" | tiempo relativo → "mañana temprano"→"08:00", "mediodía"→"12:00", "tarde"→"16:00", "noche"→"20:00" | null si no hay hora
-- priority: 1=urgente ("urgente","crítico","sí o sí"), 2=importante (reuniones,entregas), 3=opcional ("si da tiempo","cuando pueda")
-- pomodoros: 1=llamada corta, 2=tarea media, 3=concentración extendida, 4=proyecto grande
-- context: detalle relevante o null
-- title: máx 60 chars, claro y concreto
+async def parse_task_async(user_input: str, mode: str | None = None) -> dict:
+    local = _try_local(user_input, mode)
+    if local is not None:
+        return local
 
-Esquema de cada objeto:
-{{"title":"string","priority":1|2|3,"pomodoros":1|2|3|4,"target_hour":"HH:MM"|null,"context":"string"|null}}
+    model = _cache_model()
+    cached = await asyncio.to_thread(parse_cache.get, "task", user_input, PROMPT_VERSION, model)
+    if cached is not None:
+        return cached
+    key = parse_cache.make_key("task", user_input, PROMPT_VERSION, model)
+    return await _single_flight(key, lambda: _fetch_task(user_input))
 
-Texto: "{texto}"
 
-Responde SOLO con el array JSON, sin markdown:"""
+async def parse_day_async(texto: str) -> list[dict]:
+    chunks = split_day_text(texto)
+    if len(chunks) > 1:
+        return await _parse_chunks(chunks)
+    return await _parse_day_chunk(texto)
+
+
+async def _parse_day_chunk(texto: str) -> list[dict]:
+    model = _cache_model()
+    cached = await asyncio.to_thread(parse_cache.get, "day", texto, PROMPT_VERSION, model)
+    if cached is not None:
+        return cached
+    key = parse_cache.make_key("day", texto, PROMPT_VERSION, model)
+    return await _single_flight(key, lambda: _fetch_day(texto))
+
+
+async def _single_flight(key: str, factory):
+    """Peticiones idénticas concurrentes comparten una sola llamada al LLM."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: si un cliente se desconecta, la llamada compartida sigue para los demás
+    result = await asyncio.shield(task)
+    return copy.deepcopy(result)
+
+
+async def _complete(prompt: str):
+    # Timeouts, reintentos y failover por proveedor: ver providers.Router
+    async with _llm_slots:
+        provider, texto = await router.complete(prompt)
+    return provider, texto.strip()
 
+
+async def _store(kind: str, texto: str, provider, result) -> None:
+    if provider is router.primary:
+        await asyncio.to_thread(parse_cache.put, kind, texto, PROMPT_VERSION, provider.cache_id, result)
+
+
+async def _fetch_task(user_input: str) -> dict:
+    try:
+        provider, texto = await _complete(TASK_PROMPT.format(user_input=user_input))
+        result = _parse_json_response(texto, user_input)
+        if result is not None:
+            await _store("task", user_input, provider, result)
+            return result
+    except Exception as e:
+        log.warning("error con el LLM: %r", e)
+    return _local_task(user_input)
+
+
+async def _fetch_day(texto: str) -> list[dict]:
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-        )
-        texto_resp = response.choices[0].message.content.strip()
-        return _clean_json_array(texto_resp)
+        provider, texto_resp = await _complete(DAY_PROMPT.format(texto=texto))
+        tasks = _clean_json_array(texto_resp)
+        await _store("day", texto, provider, tasks)
+        return tasks
     except Exception as e:
-        print(f"Error en parse_day: {e}")
-        return [{
-            "title": texto[:60],
-            "priority": 2,
-            "pomodoros": 1,
-            "target_hour": None,
-            "context": None
-        }]
+        log.warning("error en parse_day: %r", e)
+        return _local_day(texto)
+
+
+async def parse_day_stream(texto: str):
+    """Como parse_day_async, pero entrega cada tarea en cuanto el modelo cierra su objeto."""
+    chunks = split_day_text(texto)
+    if len(chunks) > 1:
+        # Texto largo: cada trozo se entrega entero en cuanto termina, sin duplicados
+        seen: list[dict] = []
+        for done in asyncio.as_completed(_fan_out(chunks)):
+            for task in await done:
+                if _find_duplicate(seen, task) is None:
+                    seen.append(task)
+                    yield task
+        return
+
+    cached = await asyncio.to_thread(parse_cache.get, "day", texto, PROMPT_VERSION, _cache_model())
+    if cached is not None:
+        for task in cached:
+            yield task
+        return
+
+    tasks = []
+    provider = None
+    try:
+        async for provider, task in _stream_day(texto):
+            tasks.append(task)
+            yield task
+    except Exception as e:
+        log.warning("error en parse_day_stream: %r", e)
+        if not tasks:
+            for task in _local_day(texto):
+                yield task
+        return
+    # Solo una respuesta completa se guarda en caché
+    await _store("day", texto, provider, tasks)
+
+
+async def _stream_day(texto: str):
+    # El stream del modelo se vuelca a una cola dentro del semáforo y las tareas se
+    # entregan fuera: un cliente que lee despacio no retiene un hueco de _llm_slots
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        parser = _JsonArrayStream()
+        try:
+            async with _llm_slots:
+                async for provider, delta in router.stream(DAY_PROMPT.format(texto=texto)):
+                    for task in parser.feed(delta):
+                        queue.put_nowait((provider, task))
+            parser.close()
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Cliente desconectado: no hace falta seguir leyendo al modelo
+        producer.cancel()
+
+
+class _JsonArrayStream:
+    """Extrae los objetos de un array JSON a medida que llegan los tokens.
+
+    Ignora lo que haya fuera de los objetos (vallas de markdown, corchetes, comas),
+    así que no hace falta limpiar la respuesta como en _clean_json_array.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> list[dict]:
+        done = []
+        for ch in text:
+            if self.depth:
+                self.buffer.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth:
+                self.in_string = True
+            elif ch == "{":
+                if not self.depth:
+                    self.buffer = [ch]
+                self.depth += 1
+            elif ch == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    item = self._load("".join(self.buffer))
+                    if item is not None:
+                        done.append(item)
+                    self.buffer = []
+        return done
+
+    def close(self) -> None:
+        if self.depth:
+            # Un objeto a medias (respuesta cortada por límite de salida) se descarta
+            log.warning("respuesta cortada: %r", "".join(self.buffer)[:80])
+
+    @staticmethod
+    def _load(raw: str) -> dict | None:
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            log.warning("objeto inválido en el stream: %r", raw[:80])
+            return None
+        return item if isinstance(item, dict) else None
+
+
+# --- Textos largos: segmentación, parseo en paralelo y fusión ---
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\s*\n+\s*")
+_SOFT_BREAK = re.compile(r"(?<=,)\s+|\s+")
+
+
+def split_day_text(texto: str, max_chars: int = DAY_CHUNK_CHARS) -> list[str]:
+    """Parte el texto en trozos de hasta max_chars por líneas y frases.
+
+    Una frase más larga que el límite se corta por comas o espacios.
+    """
+    texto = texto.strip()
+    if len(texto) <= max_chars:
+        return [texto] if texto else []
+
+    pieces = []
+    for sentence in _SENTENCE_END.split(texto):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_pack(_SOFT_BREAK.split(sentence), max_chars, " "))
+    return _pack([p for p in pieces if p.strip()], max_chars, "\n")
+
+
+def _pack(parts: list[str], max_chars: int, sep: str) -> list[str]:
+    chunks, current = [], ""
+    for part in parts:
+        if current and len(current) + len(sep) + len(part) > max_chars:
+            chunks.append(current)
+            current = part
+        else:
+            current = f"{current}{sep}{part}" if current else part
+    if current:
+        chunks.append(current)
+    # Una palabra suelta más larga que el límite se corta sin más
+    return [c[i:i + max_chars] for c in chunks for i in range(0, len(c), max_chars)]
+
+
+def _fan_out(chunks: list[str]) -> list:
+    fanout = asyncio.Semaphore(DAY_FANOUT)
+
+    async def one(chunk: str) -> list[dict]:
+        async with fanout:
+            return await _parse_day_chunk(chunk)
+
+    return [one(c) for c in chunks]
+
+
+async def _parse_chunks(chunks: list[str]) -> list[dict]:
+    """Parsea los trozos en paralelo (cada uno con su caché) y une el resultado en orden."""
+    results = await asyncio.gather(*_fan_out(chunks))
+    merged: list[dict] = []
+    for tasks in results:
+        for task in tasks:
+            dup = _find_duplicate(merged, task)
+            if dup is None:
+                merged.append(task)
+            else:
+                # Se conserva la primera, completando lo que le falte
+                for field in ("target_hour", "context"):
+                    if not dup.get(field) and task.get(field):
+                        dup[field] = task[field]
+    return merged
+
+
+def _find_duplicate(tasks: list[dict], task: dict) -> dict | None:
+    title = parse_cache.normalize(str(task.get("title", "")))
+    for other in tasks:
+        if task.get("target_hour") and other.get("target_hour") \
+                and task["target_hour"] != other["target_hour"]:
+            continue
+        other_title = parse_cache.normalize(str(other.get("title", "")))
+        if difflib.SequenceMatcher(None, title, other_title).ratio() >= DEDUP_RATIO:
+            return other
+    return None
+
+
+def _local_task(user_input: str) -> dict:
+    metrics.inc("llm_fallback_total", kind="task")
+    return parse_local(user_input)[0]
+
+
+def _local_day(texto: str) -> list[dict]:
+    """Fallback sin LLM: una tarea por frase con el parser local."""
+    metrics.inc("llm_fallback_total", kind="day")
+    sentences = [s for s in _SENTENCE_END.split(texto.strip()) if s.strip(" .;")]
+    tasks = [parse_local(s)[0] for s in sentences[:50]]
+    return tasks or [_default_task(texto[:60])]
+
+
+def _default_task(title: str) -> dict:
+    return {
+        "title": title,
+        "priority": 2,
+        "pomodoros": 1,
+        "target_hour": None,
+        "context": None
+    }
 
 
-def _parse_json_response(texto: str, user_input: str) -> dict:
+def _parse_json_response(texto: str, user_input: str) -> dict | None:
     try:
         if texto.startswith("```json"):
             texto = texto[7:]
@@ -106,12 +411,5 @@ def _parse_json_response(texto: str, user_input: str) -> dict:
             texto = texto[:-3]
         return json.loads(texto.strip())
     except Exception as e:
-        print(f"Error parseando respuesta: {e}")
-        print(f"Respuesta cruda: {texto}")
-        return {
-            "title": user_input,
-            "priority": 2,
-            "pomodoros": 1,
-            "target_hour": None,
-            "context": None
-        }
+        log.warning("error parseando respuesta: %s; cruda: %r", e, texto[:200])
+        return None
@@ -0,0 +1,247 @@
+"""Parser local basado en reglas para tareas simples.
+
+Extrae hora, prioridad, pomodoros y título sin llamar al LLM y devuelve una
+confianza entre 0 y 1. llm_parser decide con ella si hace falta el modelo.
+"""
+import re
+import unicodedata
+
+# Mismos tiempos relativos que lista el prompt de parse_day
+RELATIVE_HOURS = [
+    ("mañana temprano", "08:00"),
+    ("mediodía", "12:00"),
+    ("por la tarde", "16:00"),
+    ("en la tarde", "16:00"),
+    ("a la tarde", "16:00"),
+    ("esta tarde", "16:00"),
+    ("por la noche", "20:00"),
+    ("en la noche", "20:00"),
+    ("a la noche", "20:00"),
+    ("esta noche", "20:00"),
+]
+
+# Sueltas también son frases corrientes ("llegué tarde"): se usan, pero sin confianza
+AMBIGUOUS_HOURS = [
+    ("temprano", "08:00"),
+    ("tarde", "16:00"),
+    ("noche", "20:00"),
+]
+
+PRIORITY_KEYWORDS = [
+    (1, ("urgente", "urgentemente", "crítico", "critico", "sí o sí", "si o si", "asap", "sin falta", "prioritario")),
+    (3, ("si da tiempo", "cuando pueda", "si puedo", "opcional", "si hay tiempo", "sin prisa")),
+]
+
+NUMBER_WORDS = {"un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4}
+
+_NUM = r"(\d+|un|uno|una|dos|tres|cuatro)"
+
+_AT = r"(?:a\s+las?\s+|a\s+eso\s+de\s+las?\s+)"
+_AMPM = r"am|pm|a\.m\.|p\.m\."
+
+# Grupos: hora, minutos (o vacío), sufijo am/pm/"de la tarde" (o vacío).
+# "2h" o "2 hrs" sin "a las" delante es una duración y "2.50" sin contexto de hora un
+# importe: solo cuentan como hora con "a las" o con sufijo
+_HOUR_PATTERNS = [
+    # 15:00, 9h30, a las 10:15 pm
+    re.compile(rf"\b{_AT}?(\d{{1,2}})[:h](\d{{2}})\s*({_AMPM})?(?:\s*(?:hs|hrs|h)\b)?", re.I),
+    # a las 9.30, 9.30 pm, 9.30hs
+    re.compile(rf"\b{_AT}(\d{{1,2}})\.(\d{{2}})\s*({_AMPM})?(?:\s*(?:hs|hrs|h)\b)?", re.I),
+    re.compile(rf"\b(\d{{1,2}})\.(\d{{2}})\s*({_AMPM}|hs|hrs|h\b)", re.I),
+    # 10am, 3 pm, a las 5 de la tarde
+    re.compile(rf"\b{_AT}?(\d{{1,2}})()\s*({_AMPM}|de\s+la\s+mañana|de\s+la\s+tarde|de\s+la\s+noche)", re.I),
+    # a las 18hs, a las 8
+    re.compile(rf"\b{_AT}(\d{{1,2}})()\s*(hs|hrs|h\b)", re.I),
+    re.compile(r"\ba\s+las?\s+(\d{1,2})()()\b(?![:.\d])", re.I),
+]
+
+_POMODORO_PATTERN = re.compile(rf"\b{_NUM}\s*(?:pomodoros?|pomos?)\b", re.I)
+_MINUTES_PATTERN = re.compile(r"\b(\d{1,3})\s*(?:min|mins|minutos)\b", re.I)
+# "2 horas", "2h", "2 hrs"; no tras "las" ("a las 9h" es una hora)
+_HOURS_DURATION = re.compile(
+    r"\b(?<!las )(?<!la )(?:durante\s+|por\s+)?"
+    r"(media\s+hora|una\s+hora|hora\s+y\s+media|(\d)\s*(?:horas?|hrs?|hs|h)\b)", re.I)
+
+# Restos que quedan colgando al quitar los fragmentos reconocidos
+_DANGLING = re.compile(r"(?:\s+|^)(?:a|al|a las|a la|para las|para la|de|y|con|en|,|-)\s*$", re.I)
+_SEPARATORS = re.compile(r"[,;]|\s(?:y luego|después|despues|luego|además|ademas|también|tambien)\s", re.I)
+_INFINITIVE = re.compile(r"^[a-záéíóúñ]+(?:ar|er|ir)(?:me|te|le|lo|la|les|los|las|se)?$", re.I)
+
+LONG_INPUT = 80
+
+
+def _strip_accents(texto: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn"
+    )
+
+
+def _word(phrase: str) -> re.Pattern:
+    return re.compile(rf"\b{re.escape(_strip_accents(phrase))}\b")
+
+
+# Se buscan sobre el texto en minúsculas y sin tildes ("mediodia" == "mediodía")
+_RELATIVE_PATTERNS = [(_word(phrase), value) for phrase, value in RELATIVE_HOURS]
+_AMBIGUOUS_PATTERNS = [(_word(word), value) for word, value in AMBIGUOUS_HOURS]
+_PRIORITY_PATTERNS = [
+    (priority, [_word(kw) for kw in keywords]) for priority, keywords in PRIORITY_KEYWORDS
+]
+
+
+def _to_24h(hour: int, minute: int, suffix: str) -> str | None:
+    suffix = (suffix or "").lower().replace(".", "")
+    if suffix in ("pm", "de la tarde", "de la noche") and hour < 12:
+        hour += 12
+    elif suffix == "am" and hour == 12:
+        hour = 0
+    elif not suffix and 1 <= hour <= 6:
+        # "a las 3" en una agenda de trabajo es casi siempre por la tarde
+        hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _extract_hour(texto: str) -> tuple[str | None, tuple[int, int] | None, bool]:
+    """(hora, posición, ambigua)."""
+    for pattern in _HOUR_PATTERNS:
+        m = pattern.search(texto)
+        if not m:
+            continue
+        hour = int(m.group(1))
+        minute = int(m.group(2)) if m.group(2) else 0
+        suffix = re.sub(r"\s+", " ", m.group(3) or "")
+        if suffix in ("hs", "hrs", "h"):
+            suffix = ""
+        value = _to_24h(hour, minute, suffix)
+        if value:
+            return value, m.span(), False
+
+    plain = _strip_accents(texto.lower())
+    for patterns, ambiguous in ((_RELATIVE_PATTERNS, False), (_AMBIGUOUS_PATTERNS, True)):
+        for pattern, value in patterns:
+            m = pattern.search(plain)
+            if m:
+                return value, m.span(), ambiguous
+    return None, None, False
+
+
+def _extract_priority(texto: str) -> tuple[int | None, list[tuple[int, int]]]:
+    plain = _strip_accents(texto.lower())
+    for priority, patterns in _PRIORITY_PATTERNS:
+        spans = []
+        for pattern in patterns:
+            m = pattern.search(plain)
+            if m:
+                spans.append(m.span())
+        if spans:
+            return priority, spans
+    return None, []
+
+
+def _number(token: str) -> int:
+    return int(token) if token.isdigit() else NUMBER_WORDS[token.lower()]
+
+
+def _extract_pomodoros(texto: str) -> tuple[int | None, tuple[int, int] | None]:
+    m = _POMODORO_PATTERN.search(texto)
+    if m:
+        return _number(m.group(1)), m.span()
+    m = _MINUTES_PATTERN.search(texto)
+    if m:
+        return -(-int(m.group(1)) // 25), m.span()
+    m = _HOURS_DURATION.search(texto)
+    if m:
+        phrase = m.group(1).lower()
+        if phrase.startswith("media"):
+            minutes = 30
+        elif phrase.startswith("hora y media"):
+            minutes = 90
+        elif phrase.startswith("una"):
+            minutes = 60
+        else:
+            minutes = int(m.group(2)) * 60
+        return -(-minutes // 25), m.span()
+    return None, None
+
+
+def _remove_spans(texto: str, spans: list[tuple[int, int]]) -> str:
+    for start, end in sorted(spans, reverse=True):
+        texto = texto[:start] + " " + texto[end:]
+    return texto
+
+
+def _clean_title(texto: str) -> str:
+    t = re.sub(r"\s+", " ", texto).strip(" ,;.-")
+    previous = None
+    while previous != t:
+        previous = t
+        t = _DANGLING.sub("", t).strip(" ,;.-")
+    t = re.sub(r"\s+([,;.])", r"\1", t)
+    return (t[:1].upper() + t[1:])[:60]
+
+
+def parse_local(texto: str) -> tuple[dict, float]:
+    """Devuelve (tarea, confianza). La tarea tiene el mismo esquema que parse_task."""
+    original = unicodedata.normalize("NFC", texto).strip()
+    spans = []
+
+    target_hour, span, ambiguous = _extract_hour(original)
+    if span:
+        spans.append(span)
+
+    priority, priority_spans = _extract_priority(original)
+    # Las posiciones se calculan sobre el texto sin tildes, que tiene la misma longitud
+    spans.extend(priority_spans)
+
+    pomodoros, span = _extract_pomodoros(original)
+    if span:
+        spans.append(span)
+
+    title = _clean_title(_remove_spans(original, _merge(spans)))
+
+    result = {
+        "title": title or original[:60],
+        "priority": priority or 2,
+        "pomodoros": max(1, min(4, pomodoros)) if pomodoros else 1,
+        "target_hour": target_hour,
+        "context": None,
+    }
+    return result, _confidence(original, title, target_hour, priority, pomodoros, ambiguous)
+
+
+def _merge(spans: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _confidence(original, title, target_hour, priority, pomodoros, ambiguous_hour=False) -> float:
+    if not title:
+        return 0.0
+    words = title.split()
+    score = 0.5
+    if ambiguous_hour:
+        # "tarde" o "noche" sueltas: puede que no sea una hora y el título pierda la palabra
+        score -= 0.1
+    elif target_hour:
+        score += 0.15
+    score += 0.1 if priority else 0.0
+    score += 0.15 if pomodoros else 0.0
+    if _INFINITIVE.match(_strip_accents(words[0])):
+        score += 0.1
+    if len(words) > 8:
+        score -= 0.15
+    if len(original) > LONG_INPUT:
+        score -= 0.2
+    if _SEPARATORS.search(original):
+        # Probablemente varias tareas o matices que el LLM resuelve mejor
+        score -= 0.25
+    if re.search(r"\d", title):
+        # Números sin interpretar: fechas, duraciones raras, cantidades
+        score -= 0.2
+    return round(max(0.0, min(1.0, score)), 2)
@@ -1,13 +1,52 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal
 import sqlite3
-from database import get_db
-from llm_parser import parse_task, parse_day
+from database import (get_db, init_db, open_pool, close_pool, day_versions, db_epoch,
+                      DEFAULT_USER, USER_ID, current_user, shards, use_user)
+from fastapi.concurrency import run_in_threadpool
+from llm_parser import parse_task_async, parse_day_async, parse_day_stream, PROMPT_VERSION
+import llm_parser
+import parse_cache
+from events import hub, replay
+import jobs
+import archive
+import metrics
+import queries
+from ordering import GAP, move_task, next_position
+from lru import LRUCache
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
 import uuid
-from datetime import date
+from datetime import date, timedelta
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El pool de conexiones se abre una vez al arrancar y se cierra al apagar
+    open_pool()
+    init_db()
+    # Descarta respuestas cacheadas con plantillas de prompt antiguas
+    parse_cache.invalidate(PROMPT_VERSION)
+    await hub.start()
+    jobs.start()
+    archive.start()
+    yield
+    archive.stop()
+    jobs.stop()
+    await hub.stop()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configurar CORS
 app.add_middleware(
@@ -17,6 +56,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def avisar_cambios(request: Request, call_next):
+    # Tras una escritura ya confirmada, el hub de eventos y los workers no esperan al sondeo
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        hub.notify()
+        jobs.notify()
+    return response
+
+slow_log = logging.getLogger("agenda.slow")
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    # Latencia por plantilla de ruta (no por URL) y consultas de BD de la petición
+    if not metrics.ENABLED:
+        return await call_next(request)
+    stats = [0, 0.0, 0]
+    metrics.request_stats.set(stats)
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.observe("http_request_seconds", elapsed, route=path,
+                    method=request.method, status=response.status_code)
+    if metrics.SLOW_REQUEST_MS and elapsed * 1000 >= metrics.SLOW_REQUEST_MS:
+        slow_log.warning("%s %s %d %.1f ms (%d consultas, %d sentencias, %.1f ms en BD)",
+                         request.method, request.url.path, response.status_code,
+                         elapsed * 1000, stats[0], stats[2], stats[1] * 1000)
+    return response
+
+@app.middleware("http")
+async def usuario_actual(request: Request, call_next):
+    # Fija el shard de la petición: cabecera X-User-Id, o ?user= para EventSource (no admite
+    # cabeceras). Va por fuera del resto: avisar_cambios necesita el usuario tras la respuesta
+    user = request.headers.get("x-user-id") or request.query_params.get("user") or DEFAULT_USER
+    if not USER_ID.match(user):
+        return JSONResponse({"detail": "Invalid user id"}, status_code=400)
+    with use_user(user):
+        return await call_next(request)
+
 # Modelos Pydantic
 class TaskIn(BaseModel):
     title: str
@@ -28,6 +108,7 @@ class TaskIn(BaseModel):
 
 class TextoIn(BaseModel):
     texto: str
+    mode: Literal["hybrid", "local", "llm"] | None = None
 
 class FeedbackIn(BaseModel):
     date: str
@@ -38,6 +119,24 @@ class DayTextIn(BaseModel):
     texto: str
     date: str | None = None
 
+# Tareas por POST /tasks/bulk; más elementos es un 422 antes de tocar la base
+BULK_LIMIT = int(os.getenv("BULK_LIMIT", "500"))
+
+class BulkTasksIn(BaseModel):
+    # Los elementos se validan uno a uno para poder informar errores por índice
+    tasks: list = Field(max_length=BULK_LIMIT)
+    strict: bool = False
+
+class MoveIn(BaseModel):
+    # Vecinos tras el movimiento: la tarea queda después de after_id y antes de before_id
+    after_id: str | None = None
+    before_id: str | None = None
+
+class ReplayIn(BaseModel):
+    # Cada elemento cambia algunos de learner.PARAMS; [{}] reproduce con los actuales
+    params: list[dict[str, float]] = [{}]
+    apply: bool = False
+
 class TaskUpdate(BaseModel):
     status: str | None = None
     title: str | None = None
@@ -45,20 +144,79 @@ class TaskUpdate(BaseModel):
     priority: int | None = None
     pomodoros: int | None = None
     target_hour: str | None = None
-    position: int | None = None
+    position: float | None = None
     pomodoros_done: int | None = None
 
+# Planes ya calculados por (usuario, fecha, estrategia, días, versiones de los días, versión de pesos)
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+_plan_cache = LRUCache(PLAN_CACHE_SIZE)
+
 # Funciones auxiliares
-def guardar_tarea(task: TaskIn) -> str:
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _conditional(request: Request, response: Response, etag: str) -> Response | None:
+    """Fija ETag/Cache-Control; devuelve un 304 si el cliente ya tiene esta versión."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def guardar_tarea(task: TaskIn) -> dict:
+    """Inserta la tarea y devuelve la fila completa (con los valores por defecto de SQLite)."""
     task_id = str(uuid.uuid4())
     task_date = task.date if task.date else str(date.today())
     with get_db() as conn:
+        # Las tareas nuevas van al final del día
         conn.execute("""
-            INSERT INTO tasks (id, title, context, priority, pomodoros, target_hour, date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (task_id, task.title, task.context, task.priority, task.pomodoros, task.target_hour, task_date))
-        conn.commit()
-    return task_id
+            INSERT INTO tasks (id, title, context, priority, pomodoros, target_hour, date, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (task_id, task.title, task.context, task.priority, task.pomodoros, task.target_hour,
+              task_date, next_position(conn, task_date)))
+        row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return dict(row)
+
+# Por debajo de SQLITE_MAX_VARIABLE_NUMBER incluso en compilaciones antiguas (999)
+SELECT_CHUNK = 500
+
+def guardar_tareas(tasks: list[TaskIn]) -> list[dict]:
+    """Inserta varias tareas con un solo executemany en una única transacción."""
+    if not tasks:
+        return []
+    today = str(date.today())
+    with get_db() as conn:
+        # Al final de cada día, en el orden del lote
+        last = {}
+        rows = []
+        for t in tasks:
+            day = t.date or today
+            if day not in last:
+                last[day] = next_position(conn, day) - GAP
+            last[day] += GAP
+            rows.append((str(uuid.uuid4()), t.title, t.context, t.priority, t.pomodoros,
+                         t.target_hour, day, last[day]))
+        ids = [r[0] for r in rows]
+        conn.executemany("""
+            INSERT INTO tasks (id, title, context, priority, pomodoros, target_hour, date, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # Por tandas: un IN (...) con todo el lote puede pasar del límite de variables de SQLite
+        by_id = {}
+        for start in range(0, len(ids), SELECT_CHUNK):
+            chunk = ids[start:start + SELECT_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = conn.execute(f"SELECT * FROM tasks WHERE id IN ({placeholders})", chunk)
+            by_id.update((t["id"], dict(t)) for t in cursor.fetchall())
+    return [by_id[i] for i in ids]
 
 @app.get("/")
 def leer_raiz():
@@ -66,35 +224,314 @@ def leer_raiz():
 
 @app.post("/tasks")
 def crear_tarea_endpoint(task: TaskIn):
-    task_id = guardar_tarea(task)
-    return {"id": task_id, "mensaje": "Tarea creada"}
+    tarea = guardar_tarea(task)
+    return {"id": tarea["id"], "mensaje": "Tarea creada", "task": tarea}
+
+@app.post("/tasks/bulk")
+def crear_tareas_bulk(data: BulkTasksIn):
+    valid, errors = [], []
+    for index, item in enumerate(data.tasks):
+        try:
+            valid.append(TaskIn.model_validate(item))
+        except ValidationError as e:
+            errors.append({"index": index, "error": e.errors(include_url=False)})
+
+    if errors and data.strict:
+        raise HTTPException(status_code=422, detail={"errors": errors})
+
+    created = guardar_tareas(valid)
+    return {"tasks": created, "count": len(created), "errors": errors}
+
+# Columnas que se pueden pedir en ?fields= (id, date y position van siempre: forman el cursor)
+TASK_FIELDS = ("id", "title", "context", "priority", "pomodoros", "pomodoros_done",
+               "target_hour", "status", "created_at", "done_at", "date", "position")
+RANGE_LIMIT = int(os.getenv("RANGE_LIMIT", "1000"))
+
+def _encode_cursor(row) -> str:
+    raw = json.dumps([row["date"], row["position"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        fecha, position, task_id = json.loads(raw)
+        return str(fecha), float(position), str(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _csv(values: list[str] | None) -> list[str]:
+    # Acepta ?status=a&status=b y ?status=a,b
+    return [v for item in values or () for v in item.split(",") if v]
+
+@app.get("/agenda")
+def listar_rango(
+    desde: date = Query(alias="from"),
+    hasta: date = Query(alias="to"),
+    status: list[str] | None = Query(None),
+    priority: list[str] | None = Query(None),
+    fields: str | None = None,
+    limit: int = Query(200, ge=1, le=RANGE_LIMIT),
+    cursor: str | None = None,
+):
+    """Tareas de un intervalo de días en una consulta, paginadas por (date, position, id)."""
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+
+    if fields:
+        wanted = [f for f in fields.split(",") if f]
+        unknown = set(wanted) - set(TASK_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {sorted(unknown)}")
+        columns = list(dict.fromkeys(["id", "date", "position"] + wanted))
+    else:
+        columns = list(TASK_FIELDS)
+
+    params: list = [str(desde), str(hasta)]
+    if cursor:
+        # El límite inferior pasa a ser el día del cursor: el índice salta las páginas anteriores
+        after = _decode_cursor(cursor)
+        params[0] = max(params[0], after[0])
+        params.extend(after)
+    statuses = _csv(status)
+    params.extend(statuses)
+    priorities = _csv(priority)
+    try:
+        params.extend(int(p) for p in priorities)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="priority must be an integer")
+
+    sql = queries.agenda_range(columns, bool(cursor), len(statuses), len(priorities))
+    with get_db() as conn:
+        rows = [dict(r) for r in conn.execute(sql, (*params, limit + 1))]
+        # Días archivados: la misma consulta en cada mes frío y mezcla por la clave del cursor
+        cold = archive.cold_rows(conn, params[0], params[1], sql, (*params, limit + 1))
+    if cold:
+        # Un archivado a medias (copiado pero aún no borrado) deja la tarea en los dos
+        # niveles: gana la fila viva
+        live = {r["id"] for r in rows}
+        cold = [r for r in cold if r["id"] not in live]
+        rows = sorted(rows + cold, key=lambda r: archive.sql_order(r["date"], r["position"], r["id"]))
+        rows = rows[:limit + 1]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "tasks": rows,
+        "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
+    }
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "100"))
+# Coincidencias más recientes que se ordenan por relevancia: bm25 cuesta una lectura por
+# fila, así que un término muy común en todo el histórico no se puntúa entero
+SEARCH_WINDOW = int(os.getenv("SEARCH_WINDOW", "250"))
+_WORDS = re.compile(r"\w+")
+
+def _fts_query(q: str) -> str:
+    # Palabras entre comillas (sin operadores FTS5 del usuario), todas obligatorias. Solo la
+    # última es prefijo, la que se está escribiendo: un prefijo largo obliga a FTS5 a fundir
+    # las listas de todos los términos que empiezan así, una palabra completa no
+    words = [f'"{w}"' for w in _WORDS.findall(q)]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+def _buscar(conn, match: str, inicio: str, fin: str, limit: int) -> tuple[list[dict], bool]:
+    """(filas, ventana llena): con la ventana llena puede haber coincidencias más antiguas sin puntuar."""
+    # 1) rowid de las últimas SEARCH_WINDOW coincidencias del rango, sin puntuar (recorre el índice)
+    window = conn.execute(queries.SEARCH_WINDOW, (match, inicio, fin, SEARCH_WINDOW)).fetchall()
+    if not window:
+        return [], False
+    # 2) bm25 solo dentro de esa ventana de rowid
+    rows = [dict(r) for r in conn.execute(
+        queries.SEARCH_RANKED, (match, window[-1][0], window[0][0], inicio, fin, limit))]
+    return rows, len(window) == SEARCH_WINDOW
+
+@app.get("/tasks/search")
+def buscar_tareas(
+    q: str = Query(min_length=1),
+    desde: date | None = Query(None, alias="from"),
+    hasta: date | None = Query(None, alias="to"),
+    limit: int = Query(20, ge=1, le=SEARCH_LIMIT),
+):
+    """Búsqueda por título y contexto, ordenada por relevancia (bm25), sin distinguir acentos.
+
+    bm25 solo puntúa las SEARCH_WINDOW coincidencias más recientes del rango (y de cada
+    mes archivado). Si alguna ventana se llenó, `truncated` es true: puede haber
+    coincidencias más antiguas y más relevantes fuera del resultado; acotar `from`/`to`
+    o afinar la consulta las alcanza.
+    """
+    match = _fts_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Query has no searchable words")
+    inicio, fin = str(desde or "0000-01-01"), str(hasta or "9999-12-31")
+    truncated = False
+
+    def buscar(c) -> list[dict]:
+        nonlocal truncated
+        found, full = _buscar(c, match, inicio, fin, limit)
+        truncated = truncated or full
+        return found
+
+    with get_db() as conn:
+        rows = buscar(conn)
+        # Cada mes archivado tiene su propio índice: bm25 solo es comparable de forma
+        # aproximada entre índices, suficiente para mezclar los mejores de cada uno
+        cold = archive.cold_map(conn, inicio, fin, buscar)
+    if cold:
+        live = {r["id"] for r in rows}
+        cold = [r for r in cold if r["id"] not in live]
+        rows = sorted(rows + cold, key=lambda r: r["rank"])[:limit]
+    return {"tasks": rows, "count": len(rows), "truncated": truncated}
 
 @app.get("/agenda/{fecha}")
-def listar_agenda(fecha: str):
+def listar_agenda(fecha: str, request: Request, response: Response):
     with get_db() as conn:
-        cursor = conn.execute("""
-            SELECT * FROM tasks
-            WHERE date = ?
-            ORDER BY position, priority, target_hour
-        """, (fecha,))
-        tareas = cursor.fetchall()
-        return [dict(t) for t in tareas]
+        etag = _etag("agenda", db_epoch(conn), day_versions(conn, fecha))
+        not_modified = _conditional(request, response, etag)
+        if not_modified:
+            return not_modified
+        tareas = [dict(t) for t in conn.execute(queries.AGENDA_DAY, (fecha,))]
+        cold = archive.cold_rows(conn, fecha, fecha, queries.AGENDA_DAY, (fecha,))
+    if cold:
+        live = {t["id"] for t in tareas}
+        cold = [t for t in cold if t["id"] not in live]
+        tareas = sorted(tareas + cold, key=lambda t: archive.sql_order(
+            t["position"], t["priority"], t["target_hour"]))
+    return tareas
+
+# Tamaño máximo de página de /changes
+CHANGES_LIMIT = int(os.getenv("CHANGES_LIMIT", "500"))
+
+@app.get("/changes")
+def cambios_desde(
+    since: int | None = Query(None, ge=0),
+    fecha: str | None = None,
+    limit: int = Query(CHANGES_LIMIT, ge=1, le=CHANGES_LIMIT),
+):
+    """Sincronización delta: tareas que cambiaron después del cursor `since`.
+
+    Sin `since` solo devuelve el cursor actual (para empezar tras una carga completa).
+    Las tareas canceladas, borradas o movidas a otro día (con `fecha`) salen como lápidas.
+    """
+    with get_db() as conn:
+        if since is None:
+            head = conn.execute(queries.CHANGES_HEAD).fetchone()[0]
+            return {"cursor": head, "tasks": [], "deleted": [], "has_more": False}
+
+        if fecha:
+            rows = conn.execute(queries.CHANGES_SINCE_DATE, (fecha, since, limit + 1)).fetchall()
+        else:
+            rows = conn.execute(queries.CHANGES_SINCE, (since, limit + 1)).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        ids = list(dict.fromkeys(r["task_id"] for r in rows))
+        current = {}
+        if ids:
+            placeholders = ", ".join("?" * len(ids))
+            cursor = conn.execute(f"SELECT * FROM tasks WHERE id IN ({placeholders})", ids)
+            current = {t["id"]: dict(t) for t in cursor.fetchall()}
+
+    tasks, deleted = [], []
+    for task_id in ids:
+        t = current.get(task_id)
+        if t is None or t["status"] == "cancelled" or (fecha and t["date"] != fecha):
+            deleted.append(task_id)
+        else:
+            tasks.append(t)
+    return {
+        "cursor": rows[-1]["seq"] if rows else since,
+        "tasks": tasks,
+        "deleted": deleted,
+        "has_more": has_more,
+    }
+
+@app.get("/agenda/{fecha}/events")
+async def eventos_agenda(fecha: str, request: Request):
+    """SSE: task-changed, plan-invalidated y weights-changed del día según se confirman."""
+    last_id = request.headers.get("last-event-id")
+
+    async def stream():
+        sub = await hub.subscribe(fecha)
+        try:
+            yield "retry: 3000\n\n"
+            if last_id and last_id.isdigit():
+                for message in await run_in_threadpool(replay, fecha, int(last_id)):
+                    yield message
+            while True:
+                yield await sub.next()
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 @app.patch("/tasks/reorder")
 def reordenar_tareas(orden: list[dict]):
+    # Compatibilidad: renumeración completa enviada por el cliente, en un solo executemany
     with get_db() as conn:
-        for item in orden:
-            conn.execute("UPDATE tasks SET position = ? WHERE id = ?", (item['position'], item['id']))
-        conn.commit()
+        conn.executemany(
+            "UPDATE tasks SET position = ? WHERE id = ?",
+            [(item['position'], item['id']) for item in orden],
+        )
     return {"ok": True}
 
+@app.patch("/tasks/{task_id}/move")
+def mover_tarea(task_id: str, move: MoveIn):
+    """Mueve la tarea entre dos vecinas del mismo día; sin vecinas la deja al final."""
+    try:
+        with get_db() as conn:
+            result = move_task(conn, task_id, move.after_id, move.before_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return result
+
 @app.post("/parse")
-def parsear_texto(data: TextoIn):
-    return parse_task(data.texto)
+async def parsear_texto(data: TextoIn):
+    return await parse_task_async(data.texto, data.mode)
+
+@app.get("/parse/cache")
+def estadisticas_cache():
+    return parse_cache.get_stats() | {"prompt_version": PROMPT_VERSION}
+
+
+@app.get("/metrics")
+def exportar_metricas():
+    cache = parse_cache.get_stats()
+    text = metrics.render(
+        gauges={
+            "sse_subscribers": hub.subscriber_count(),
+            "db_shards_open": shards.open_count(),
+            "parse_cache_memory_entries": cache["memory_entries"],
+        },
+        counters={
+            "db_statements_total": metrics.statements_total(),
+        } | {
+            f"parse_cache_{name}_total": cache[name]
+            for name in ("memory_hits", "db_hits", "misses", "stores")
+        },
+    )
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/llm/health")
+def estado_llm():
+    # Estado de los cortacircuitos y del presupuesto de reintentos de cada proveedor
+    return llm_parser.router.health()
+
+
+@app.delete("/parse/cache")
+def vaciar_cache():
+    deleted = parse_cache.invalidate()
+    return {"ok": True, "deleted": deleted}
 
 @app.post("/tasks/from-text")
-def crear_tarea_desde_texto(data: TextoIn):
-    parsed = parse_task(data.texto)
+async def crear_tarea_desde_texto(data: TextoIn):
+    parsed = await parse_task_async(data.texto, data.mode)
     tarea = TaskIn(
         title=parsed.get("title", "Sin título"),
         context=parsed.get("context"),
@@ -102,8 +539,8 @@ def crear_tarea_desde_texto(data: TextoIn):
         pomodoros=parsed.get("pomodoros", 1),
         target_hour=parsed.get("target_hour")
     )
-    task_id = guardar_tarea(tarea)
-    return {"id": task_id, "mensaje": "Tarea creada desde texto"}
+    creada = await run_in_threadpool(guardar_tarea, tarea)
+    return {"id": creada["id"], "mensaje": "Tarea creada desde texto", "task": creada}
 
 @app.patch("/tasks/{task_id}")
 def actualizar_tarea(task_id: str, updates: TaskUpdate):
@@ -127,51 +564,135 @@ def actualizar_tarea(task_id: str, updates: TaskUpdate):
         
         query = f"UPDATE tasks SET {', '.join(set_clauses)} WHERE id = ?"
         conn.execute(query, values)
-        conn.commit()
-        
+
+        # El outcome se encola en la misma transacción y se registra fuera de la petición
+        if updates.status == 'done':
+            actual = updates.pomodoros_done if updates.pomodoros_done else 1
+            jobs.enqueue(conn, "task_outcome", {"task_id": task_id, "actual_pomodoros": actual},
+                         dedupe_key=f"outcome:{task_id}")
+
         # Retornar la tarea actualizada
         cursor = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         result = dict(task) if task else {"error": "Task not found"}
 
-    if updates.status == 'done':
-        from learner import record_task_outcome
-        actual = updates.pomodoros_done if updates.pomodoros_done else 1
-        record_task_outcome(task_id, was_completed=True, actual_pomodoros=actual)
-
     return result
 
 @app.post("/feedback")
 def guardar_feedback(fb: FeedbackIn):
     with get_db() as conn:
-        cursor = conn.execute("SELECT COUNT(*) as total FROM tasks WHERE date = ?", (fb.date,))
-        total = cursor.fetchone()['total']
-        cursor = conn.execute("SELECT COUNT(*) as done FROM tasks WHERE date = ? AND status = 'done'", (fb.date,))
-        done = cursor.fetchone()['done']
+        # Conteos ya mantenidos por triggers en daily_stats (ver migración 4)
+        row = conn.execute(
+            "SELECT tasks_total, tasks_done FROM daily_stats WHERE date = ?", (fb.date,)
+        ).fetchone()
+        total = row['tasks_total'] if row else 0
+        done = row['tasks_done'] if row else 0
 
-        conn.execute("""
+        cursor = conn.execute("""
             INSERT INTO feedback (date, score, notes, tasks_done, tasks_total)
             VALUES (?, ?, ?, ?, ?)
         """, (fb.date, fb.score, fb.notes, done, total))
-        conn.commit()
 
-    from learner import process_feedback
-    learning_result = process_feedback(fb.date, fb.score, fb.notes)
-    return {"ok": True, "learning": learning_result}
+        # El aprendizaje se hace en segundo plano; el resultado se consulta en /jobs/{id}
+        job_id = jobs.enqueue(conn, "feedback",
+                              {"date": fb.date, "score": fb.score, "notes": fb.notes},
+                              dedupe_key=f"feedback:{cursor.lastrowid}")
+    return {"ok": True, "job_id": job_id, "learning": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def obtener_trabajo(job_id: int):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/feedback/{fecha}")
+def obtener_feedback(fecha: str):
+    with get_db() as conn:
+        fb = conn.execute(queries.FEEDBACK_LAST, (fecha,)).fetchone()
+        if fb is None:
+            raise HTTPException(status_code=404, detail="Feedback not found")
+        stats = conn.execute(queries.DAY_STATS, (fecha,)).fetchone()
+    return dict(fb) | {
+        "tasks_done": stats["tasks_done"] if stats else 0,
+        "tasks_total": stats["tasks_total"] if stats else 0,
+    }
+
+
+@app.get("/stats")
+def obtener_estadisticas(days: int = Query(7, ge=1, le=366), hasta: date | None = None):
+    fin = hasta or date.today()
+    inicio = fin - timedelta(days=days - 1)
+    with get_db() as conn:
+        rows = {
+            r["date"]: r for r in conn.execute(queries.STATS_RANGE, (str(inicio), str(fin)))
+        }
+
+    dias = []
+    for i in range(days):
+        d = str(inicio + timedelta(days=i))
+        r = rows.get(d)
+        dias.append({
+            "date": d,
+            "total": r["tasks_total"] if r else 0,
+            "done": r["tasks_done"] if r else 0,
+            "pomodoros": r["pomodoros_done"] if r else 0,
+            "pomodoros_planned": r["pomodoros_planned"] if r else 0,
+            "score": r["feedback_score"] if r else None,
+        })
+
+    scores = [d["score"] for d in dias if d["score"] is not None]
+    total = sum(d["total"] for d in dias)
+    return {
+        "days": dias,
+        "avg_score": round(sum(scores) / len(scores), 2) if scores else 0,
+        "completion_rate": round(sum(d["done"] for d in dias) / total, 4) if total else 0,
+        "total_pomodoros": sum(d["pomodoros"] for d in dias),
+    }
 
 
 @app.post("/parse-day")
-def parsear_dia(data: DayTextIn):
-    return parse_day(data.texto)
+async def parsear_dia(data: DayTextIn):
+    return await parse_day_async(data.texto)
+
+
+@app.post("/parse-day/stream")
+async def parsear_dia_stream(data: DayTextIn, insert: bool = False):
+    """NDJSON: una línea por tarea en cuanto el modelo la termina.
+
+    Con insert=true cada tarea se guarda al llegar y la línea lleva la fila creada.
+    """
+    task_date = data.date if data.date else str(date.today())
+
+    async def stream():
+        async for parsed in parse_day_stream(data.texto):
+            if insert:
+                tarea = TaskIn(
+                    title=parsed.get("title", "Sin título"),
+                    context=parsed.get("context"),
+                    priority=parsed.get("priority", 2),
+                    pomodoros=parsed.get("pomodoros", 1),
+                    target_hour=parsed.get("target_hour"),
+                    date=task_date,
+                )
+                parsed = await run_in_threadpool(guardar_tarea, tarea)
+                hub.notify()
+            yield json.dumps(parsed, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 @app.post("/tasks/from-day-text")
-def crear_tareas_desde_dia(data: DayTextIn):
+async def crear_tareas_desde_dia(data: DayTextIn):
     task_date = data.date if data.date else str(date.today())
-    parsed_tasks = parse_day(data.texto)
-    saved = []
-    for parsed in parsed_tasks:
-        tarea = TaskIn(
+    parsed_tasks = await parse_day_async(data.texto)
+    tareas = [
+        TaskIn(
             title=parsed.get("title", "Sin título"),
             context=parsed.get("context"),
             priority=parsed.get("priority", 2),
@@ -179,25 +700,62 @@ def crear_tareas_desde_dia(data: DayTextIn):
             target_hour=parsed.get("target_hour"),
             date=task_date,
         )
-        task_id = guardar_tarea(tarea)
-        saved.append({"id": task_id, "title": tarea.title})
+        for parsed in parsed_tasks
+    ]
+    created = await run_in_threadpool(guardar_tareas, tareas)
+    saved = [{"id": t["id"], "title": t["title"]} for t in created]
     return {"tasks": saved, "count": len(saved)}
 
 
 @app.get("/agenda/{fecha}/plan")
-def obtener_plan(fecha: str):
-    from planner import generate_agenda
+def obtener_plan(
+    fecha: date,
+    request: Request,
+    response: Response,
+    strategy: Literal["priority", "best_fit", "greedy"] = "priority",
+    days: int = Query(1, ge=1, le=62),
+):
+    from planner import generate_agenda, plan_days
+    from learner import get_planner_weights, weights_version
+    dia, hasta = str(fecha), str(fecha + timedelta(days=days - 1))
     with get_db() as conn:
-        cursor = conn.execute(
-            "SELECT * FROM tasks WHERE date = ? AND status != 'done'", (fecha,)
-        )
+        key = (current_user.get(), dia, strategy, days,
+               day_versions(conn, dia, hasta), weights_version(conn))
+        etag = _etag("plan", db_epoch(conn), key)
+        not_modified = _conditional(request, response, etag)
+        if not_modified:
+            return not_modified
+        cached = _plan_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if days > 1:
+            cursor = conn.execute(queries.PLAN_RANGE, (dia, hasta))
+        else:
+            cursor = conn.execute(queries.PLAN_DAY, (dia,))
         tasks = [dict(t) for t in cursor.fetchall()]
-    if not tasks:
-        return []
-    return generate_agenda(tasks, fecha)
+        weights = get_planner_weights(conn) if tasks or days > 1 else None
+
+    if days > 1:
+        # Horizonte de varios días: lo que no cabe pasa al día siguiente
+        plan = plan_days(tasks, dia, days, weights, strategy)
+    else:
+        plan = generate_agenda(tasks, dia, weights, strategy) if tasks else []
+    _plan_cache.put(key, plan)
+    return plan
 
 
 @app.get("/learning/weights")
 def obtener_pesos():
     from learner import get_planner_weights
-    return get_planner_weights()
\ No newline at end of file
+    return get_planner_weights()
+
+
+@app.post("/learning/replay")
+def reproducir_aprendizaje(data: ReplayIn):
+    """Recalcula los pesos desde todo el histórico; varios juegos de parámetros = backtest."""
+    from replay import replay
+    try:
+        return replay(data.params or [{}], data.apply)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,201 @@
+"""Métricas en memoria con salida en formato Prometheus (GET /metrics).
+
+Histogramas de buckets fijos y contadores con etiquetas, protegidos por un único
+lock: registrar una observación es un bisect y dos sumas. METRICS=0 lo desactiva.
+
+Además de las métricas de la app, aquí viven las piezas de instrumentación:
+- `timed`: decorador para planner y learner
+- `TimedConnection`: conexión sqlite3 que mide execute() por consulta normalizada;
+  el trace callback cuenta cada sentencia que ejecuta SQLite (triggers incluidos)
+- `request_stats`: [consultas, segundos en BD, sentencias] de la petición en curso
+"""
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))   # 0 = sin log de peticiones lentas
+
+# Segundos: de 0.5 ms a 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms: dict[str, dict] = {}
+_counters: dict[str, dict] = {}
+_help: dict[str, str] = {}
+
+
+def describe(name: str, help_text: str) -> None:
+    _help[name] = help_text
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if not ENABLED:
+        return
+    key = tuple(sorted(labels.items()))
+    i = bisect_left(LATENCY_BUCKETS, value)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        h = series.get(key)
+        if h is None:
+            h = series[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        h[0][i] += 1
+        h[1] += value
+        h[2] += 1
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    if not ENABLED:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def timed(name: str, **labels):
+    """Decorador: registra la duración de la función en el histograma `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper if ENABLED else fn
+    return decorator
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# --- Exposición ---
+
+def _labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(gauges: dict[str, float] | None = None, counters: dict[str, float] | None = None) -> str:
+    lines = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_labels(key)} {value}")
+        for name, series in sorted(_histograms.items()):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (buckets, total, count) in series.items():
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += n
+                    le = 'le="%s"' % bound
+                    lines.append(f"{name}_bucket{_labels(key, le)} {cumulative}")
+                inf = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_labels(key, inf)} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_labels(key)} {count}")
+    # Valores que ya llevan otros módulos (caché de parseo, hub de eventos...)
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        for name, value in (values or {}).items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Peticiones: consultas y tiempo de BD de la petición en curso ---
+
+request_stats: ContextVar[list | None] = ContextVar("request_stats", default=None)
+
+
+# --- SQLite ---
+
+_SPACES = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b", re.I)
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Forma canónica: sin literales ni listas IN de longitud variable, en una línea."""
+    sql = _SPACES.sub(" ", sql).strip()
+    sql = _LITERALS.sub("?", sql)
+    return _IN_LIST.sub("(?...)", sql)[:200]
+
+
+def _trace(statement: str) -> None:
+    # SQLite avisa una vez por sentencia y otra por cada programa de trigger que dispara,
+    # además de BEGIN/COMMIT. El texto llega con los valores ya sustituidos, así que no
+    # se normaliza aquí (sería una regex por sentencia): solo se cuenta
+    global _statements  # sin lock: un contador aproximado basta
+    _statements += 1
+    stats = request_stats.get()
+    if stats is not None:
+        stats[2] += 1
+
+
+_statements = 0
+
+
+def statements_total() -> int:
+    return _statements
+
+
+class TimedConnection(sqlite3.Connection):
+    """Mide execute/executemany. La lectura posterior de filas queda fuera de la medida."""
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+
+def _record(sql: str, elapsed: float) -> None:
+    observe("db_query_seconds", elapsed, query=normalize_sql(sql))
+    stats = request_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument(conn: sqlite3.Connection) -> None:
+    if ENABLED:
+        conn.set_trace_callback(_trace)
+
+
+describe("http_request_seconds", "Latencia por ruta, método y código de estado")
+describe("db_query_seconds", "Duración de execute() por consulta normalizada")
+describe("llm_request_seconds", "Latencia de llamadas al LLM por proveedor y resultado")
+describe("llm_tokens_total", "Tokens consumidos por proveedor y tipo")
+describe("llm_fallback_total", "Respuestas servidas por el parser local en lugar del LLM")
+describe("planner_seconds", "Duración del planificador por función")
+describe("learner_seconds", "Duración del learner por función")
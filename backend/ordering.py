@@ -0,0 +1,104 @@
+"""Orden de tareas dentro del día con claves fraccionarias.
+
+Mover una tarea entre dos vecinas escribe una sola fila: la nueva posición es
+el punto medio de las posiciones vecinas. Cuando ya no queda hueco (empates
+o claves demasiado densas), se renumera el día completo con separación GAP.
+"""
+
+GAP = 1024.0
+MIN_GAP = 1e-6
+
+
+def move_task(conn, task_id: str, after_id: str | None, before_id: str | None) -> dict | None:
+    """Coloca task_id entre after_id y before_id. None si alguna tarea no existe.
+
+    ValueError si los vecinos no sirven: la propia tarea, otro día o en orden inverso.
+    """
+    row = conn.execute("SELECT date FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    if row is None:
+        return None
+    day = row["date"]
+    if task_id in (after_id, before_id):
+        raise ValueError("A task cannot be its own neighbour")
+
+    neighbours = _positions(conn, day, after_id, before_id)
+    if neighbours is None:
+        return None
+    lo, hi = neighbours
+    if lo is not None and hi is not None and lo > hi:
+        raise ValueError("after_id must come before before_id")
+
+    rebalanced = False
+    if lo is None and hi is None:
+        # Sin vecinos: al final del día
+        position = _last(conn, day, task_id) + GAP
+    else:
+        position = _between(lo, hi)
+    if position is None:
+        # Empate o claves demasiado densas: el hueco se agotó de verdad
+        rebalance(conn, day)
+        rebalanced = True
+        lo, hi = _positions(conn, day, after_id, before_id)
+        position = _between(lo, hi)
+        if position is None:
+            # Tras renumerar solo puede fallar si el orden actual es el inverso
+            raise ValueError("after_id must come before before_id")
+
+    conn.execute("UPDATE tasks SET position = ? WHERE id = ?", (position, task_id))
+    return {"id": task_id, "position": position, "rebalanced": rebalanced}
+
+
+def next_position(conn, day: str) -> float:
+    """Posición para una tarea nueva del día: detrás de la última."""
+    return _last(conn, day) + GAP
+
+
+def rebalance(conn, day: str) -> int:
+    """Renumera las tareas del día en su orden actual con posiciones 0, GAP, 2·GAP…"""
+    ids = [r["id"] for r in conn.execute("""
+        SELECT id FROM tasks
+        WHERE date = ?
+        ORDER BY position, priority, target_hour
+    """, (day,))]
+    conn.executemany(
+        "UPDATE tasks SET position = ? WHERE id = ?",
+        [(i * GAP, task_id) for i, task_id in enumerate(ids)],
+    )
+    return len(ids)
+
+
+def _last(conn, day: str, exclude: str | None = None) -> float:
+    # -GAP en un día vacío, así la primera tarea queda en 0
+    return conn.execute(
+        "SELECT COALESCE(MAX(position), ?) FROM tasks WHERE date = ? AND id IS NOT ?",
+        (-GAP, day, exclude),
+    ).fetchone()[0]
+
+
+def _positions(conn, day, after_id, before_id):
+    wanted = [i for i in (after_id, before_id) if i]
+    if not wanted:
+        return None, None
+    placeholders = ", ".join("?" * len(wanted))
+    found = {
+        r["id"]: r
+        for r in conn.execute(f"SELECT id, date, position FROM tasks WHERE id IN ({placeholders})", wanted)
+    }
+    if len(found) != len(set(wanted)):
+        return None
+    if any(r["date"] != day for r in found.values()):
+        raise ValueError("Neighbours must be on the same day as the task")
+    return (
+        found[after_id]["position"] if after_id else None,
+        found[before_id]["position"] if before_id else None,
+    )
+
+
+def _between(lo, hi) -> float | None:
+    if lo is not None and hi is not None:
+        if hi - lo < MIN_GAP:
+            return None
+        return (lo + hi) / 2
+    if lo is not None:
+        return lo + GAP
+    return hi - GAP
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+from database import DEFAULT_USER, get_db, use_user
+from lru import LRUCache
+
+LRU_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "1024"))
+LRU_TTL = float(os.getenv("PARSE_CACHE_TTL", "3600"))  # segundos
+
+_SPACES = re.compile(r"\s+")
+
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        stats[name] += 1
+
+
+def normalize(texto: str) -> str:
+    """Forma canónica del texto: mismas tareas escritas distinto comparten entrada."""
+    t = unicodedata.normalize("NFKC", texto).casefold()
+    t = _SPACES.sub(" ", t).strip()
+    return t.rstrip(".!¡?¿ ")
+
+
+def make_key(kind: str, texto: str, prompt_version: str, model: str) -> str:
+    raw = "\x1f".join((kind, normalize(texto), prompt_version, model))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_memory = LRUCache(LRU_SIZE, LRU_TTL)
+
+
+def _db():
+    # La caché es por contenido y compartida entre usuarios: vive siempre en la base
+    # por defecto, no en el shard del que pregunta
+    with use_user(DEFAULT_USER):
+        return get_db()
+
+
+def get(kind: str, texto: str, prompt_version: str, model: str):
+    """Busca primero en memoria y luego en SQLite. Devuelve una copia nueva o None."""
+    key = make_key(kind, texto, prompt_version, model)
+    value = _memory.get(key)
+    if value is not None:
+        _count("memory_hits")
+        return json.loads(value)
+
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT result FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None:
+        _count("misses")
+        return None
+
+    _count("db_hits")
+    _memory.put(key, row["result"])
+    return json.loads(row["result"])
+
+
+def put(kind: str, texto: str, prompt_version: str, model: str, result) -> None:
+    key = make_key(kind, texto, prompt_version, model)
+    value = json.dumps(result, ensure_ascii=False)
+    _memory.put(key, value)
+    with _db() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO llm_cache (key, kind, prompt_version, model, result)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, kind, prompt_version, model, value))
+    _count("stores")
+
+
+def invalidate(prompt_version: str | None = None) -> int:
+    """Vacía la caché. Con prompt_version, borra solo las entradas de otras versiones."""
+    _memory.clear()
+    with _db() as conn:
+        if prompt_version is None:
+            cur = conn.execute("DELETE FROM llm_cache")
+        else:
+            cur = conn.execute(
+                "DELETE FROM llm_cache WHERE prompt_version != ?", (prompt_version,)
+            )
+        return cur.rowcount
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        result = dict(stats)
+    lookups = result["memory_hits"] + result["db_hits"] + result["misses"]
+    result["hit_rate"] = round((lookups - result["misses"]) / lookups, 4) if lookups else 0.0
+    result["memory_entries"] = len(_memory)
+    return result
@@ -1,9 +1,21 @@
+from bisect import bisect_right
+from datetime import date as date_cls, timedelta
+
+from metrics import timed
+
 POMODORO_MIN = 25
 GAP_MIN = 5
 DAY_END = 21 * 60
+DAY_LIMIT = 24 * 60
+ROLL_BONUS = 0.5  # puntos extra por cada día que una tarea lleva arrastrada
+
+STRATEGIES = ("priority", "best_fit", "greedy")
+DEFAULT_STRATEGY = "priority"
 
 
-def generate_agenda(tasks: list[dict], date: str, weights: dict | None = None) -> list[dict]:
+@timed("planner_seconds", fn="generate_agenda")
+def generate_agenda(tasks: list[dict], date: str, weights: dict | None = None,
+                    strategy: str = DEFAULT_STRATEGY) -> list[dict]:
     from learner import get_planner_weights
     if weights is None:
         weights = get_planner_weights()
@@ -15,11 +27,17 @@ def generate_agenda(tasks: list[dict], date: str, weights: dict | None = None) -
     free     = [t for t in tasks if not t.get("target_hour")]
 
     for t in free:
-        t["_score"] = (4 - t["priority"]) * weights.get("priority_weight", 1.0) \
-                    + weights.get("morning_weight", 1.0)
+        t["_score"] = _score(t, weights)
 
     free_sorted = sorted(free, key=lambda t: t["_score"], reverse=True)
-    planned = _assign_blocks(anchored, free_sorted, start_h, pomo_acc)
+    if strategy == "greedy":
+        planned = _assign_blocks(anchored, free_sorted, start_h, pomo_acc)
+    else:
+        day = _DayPlan(start_h * 60, pomo_acc)
+        # Las fijas sin hueco a su hora compiten con las libres y se marcan como conflicto
+        moved = [t | {"conflict": True} for t in day.place_anchored(anchored)]
+        unplaced = day.place_free(_order(free_sorted + moved, strategy, pomo_acc, weights), strategy)
+        planned = day.result() + [t | {"suggested_start": None} for t in unplaced]
 
     for t in planned:
         t.pop("_score", None)
@@ -27,7 +45,202 @@ def generate_agenda(tasks: list[dict], date: str, weights: dict | None = None) -
     return planned
 
 
+@timed("planner_seconds", fn="plan_days")
+def plan_days(tasks: list[dict], start_date: str, days: int, weights: dict | None = None,
+              strategy: str = DEFAULT_STRATEGY) -> dict:
+    """Planifica varios días seguidos; lo que no cabe en un día pasa al siguiente."""
+    from learner import get_planner_weights
+    if weights is None:
+        weights = get_planner_weights()
+
+    pomo_acc = weights.get("pomodoro_accuracy", 1.0)
+    start_h  = int(weights.get("preferred_start_hour", 9))
+    first = date_cls.fromisoformat(start_date)
+    dates = [str(first + timedelta(days=i)) for i in range(days)]
+
+    by_date = {d: [] for d in dates}
+    for t in tasks:
+        if t.get("date") in by_date:
+            by_date[t["date"]].append(t)
+
+    plans = {}
+    carry: list[dict] = []
+    for d in dates:
+        own = by_date[d]
+        for t in carry:
+            t["_score"] = _score(t, weights) + ROLL_BONUS * t["_rolled"]
+        for t in own:
+            if not t.get("target_hour"):
+                t["_score"] = _score(t, weights)
+
+        day = _DayPlan(start_h * 60, pomo_acc)
+        pending = [t | {"conflict": True}
+                   for t in day.place_anchored([t for t in own if t.get("target_hour")])]
+        pending += [t for t in own if not t.get("target_hour")] + carry
+        carry = day.place_free(_order(pending, strategy, pomo_acc, weights), strategy)
+        for t in carry:
+            t["_rolled"] = t.get("_rolled", 0) + 1
+            t.setdefault("rolled_from", t.get("date"))
+        plans[d] = [_clean(t) for t in day.result()]
+
+    return {"days": plans, "unplaced": [_clean(t) | {"suggested_start": None} for t in carry]}
+
+
+def _score(t: dict, weights: dict) -> float:
+    return (4 - t["priority"]) * weights.get("priority_weight", 1.0) \
+         + weights.get("morning_weight", 1.0)
+
+
+def _clean(t: dict) -> dict:
+    return {k: v for k, v in t.items() if k not in ("_score", "_rolled")}
+
+
+def _duration(t: dict, pomo_acc: float) -> int:
+    return int(t["pomodoros"] * POMODORO_MIN * pomo_acc)
+
+
+def _order(free: list[dict], strategy: str, pomo_acc: float, weights: dict) -> list[dict]:
+    for t in free:
+        if "_score" not in t:
+            t["_score"] = _score(t, weights)
+    if strategy == "best_fit":
+        # Best-fit decreasing: las tareas largas primero dejan menos huecos inútiles
+        return sorted(free, key=lambda t: (-_duration(t, pomo_acc), -t["_score"]))
+    return sorted(free, key=lambda t: t["_score"], reverse=True)
+
+
+class FreeList:
+    """Intervalos libres [inicio, fin) en minutos, disjuntos y ordenados.
+
+    Las búsquedas usan bisect sobre los inicios, así que reservar o comprobar
+    un hueco cuesta O(log n) más los intervalos que se tocan.
+    """
+
+    def __init__(self, start: int = 0, end: int = DAY_LIMIT):
+        self.starts = [start]
+        self.ends = [end]
+
+    def fits(self, start: int, end: int) -> bool:
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def reserve(self, start: int, end: int) -> None:
+        i = max(bisect_right(self.starts, start) - 1, 0)
+        new_starts, new_ends = [], []
+        j = i
+        while j < len(self.starts) and self.starts[j] < end:
+            s, e = self.starts[j], self.ends[j]
+            if e > start:
+                if s < start:
+                    new_starts.append(s)
+                    new_ends.append(start)
+                if e > end:
+                    new_starts.append(end)
+                    new_ends.append(e)
+            else:
+                new_starts.append(s)
+                new_ends.append(e)
+            j += 1
+        self.starts[i:j] = new_starts
+        self.ends[i:j] = new_ends
+
+    def first_fit(self, dur: int, lo: int, hi: int) -> int | None:
+        i = max(bisect_right(self.starts, lo) - 1, 0)
+        for j in range(i, len(self.starts)):
+            s = max(self.starts[j], lo)
+            if s >= hi:
+                break
+            if min(self.ends[j], hi) - s >= dur:
+                return s
+        return None
+
+    def best_fit(self, dur: int, lo: int, hi: int) -> int | None:
+        best, best_len = None, None
+        i = max(bisect_right(self.starts, lo) - 1, 0)
+        for j in range(i, len(self.starts)):
+            s = max(self.starts[j], lo)
+            if s >= hi:
+                break
+            length = min(self.ends[j], hi) - s
+            if length >= dur and (best_len is None or length < best_len):
+                best, best_len = s, length
+        return best
+
+    def largest(self, lo: int, hi: int) -> int:
+        largest = 0
+        i = max(bisect_right(self.starts, lo) - 1, 0)
+        for j in range(i, len(self.starts)):
+            s = max(self.starts[j], lo)
+            if s >= hi:
+                break
+            largest = max(largest, min(self.ends[j], hi) - s)
+        return largest
+
+
+class _DayPlan:
+    def __init__(self, day_start: int, pomo_acc: float):
+        self.day_start = day_start
+        self.pomo_acc = pomo_acc
+        self.free = FreeList()
+        self.placed: list[tuple[int, dict]] = []
+
+    def place_anchored(self, anchored: list[dict]) -> list[dict]:
+        """Reserva las tareas con hora fija; las que se solapan se mueven al siguiente hueco.
+
+        Gana la de mayor prioridad (y a igual prioridad, la que empieza antes).
+        Devuelve las que no encuentran hueco en todo el día.
+        """
+        unplaced = []
+        ends = []
+        for t in sorted(anchored, key=lambda t: (t["priority"], _to_min(t["target_hour"]))):
+            start = _to_min(t["target_hour"])
+            dur = _duration(t, self.pomo_acc)
+            if self.free.fits(start, start + dur):
+                self.free.reserve(start, start + dur)
+                self.placed.append((start, t))
+            else:
+                shifted = self.free.first_fit(dur + GAP_MIN, start, max(DAY_END, start + dur))
+                if shifted is None:
+                    unplaced.append(t)
+                    continue
+                if shifted > start:
+                    # El hueco empieza justo donde termina otro bloque: dejar el descanso
+                    shifted += GAP_MIN
+                self.free.reserve(shifted, shifted + dur)
+                self.placed.append((shifted, t | {"conflict": True}))
+                start = shifted
+            ends.append(start + dur)
+        # Margen de descanso tras cada bloque fijo, solo donde sigue libre
+        for end in ends:
+            self.free.reserve(end, end + GAP_MIN)
+        return unplaced
+
+    def place_free(self, free_sorted: list[dict], strategy: str) -> list[dict]:
+        unplaced = []
+        find = self.free.best_fit if strategy == "best_fit" else self.free.first_fit
+        room = self.free.largest(self.day_start, DAY_END)
+        shortest = _duration({"pomodoros": 1}, self.pomo_acc)
+        for i, t in enumerate(free_sorted):
+            if room < shortest:
+                # Día lleno: nada más puede entrar
+                unplaced.extend(free_sorted[i:])
+                break
+            dur = _duration(t, self.pomo_acc)
+            start = find(dur, self.day_start, DAY_END) if dur <= room else None
+            if start is None:
+                unplaced.append(t)
+                continue
+            self.free.reserve(start, start + dur + GAP_MIN)
+            self.placed.append((start, t))
+            room = self.free.largest(self.day_start, DAY_END)
+        return unplaced
+
+    def result(self) -> list[dict]:
+        return [t | {"suggested_start": _to_hhmm(s)} for s, t in sorted(self.placed, key=lambda p: p[0])]
+
+
 def _assign_blocks(anchored, free_sorted, start_h, pomo_acc):
+    # Planificador voraz original (estrategia "greedy"): se conserva como referencia
     occupied = sorted([
         {
             "start": _to_min(t["target_hour"]),
@@ -0,0 +1,376 @@
+"""Proveedores de LLM intercambiables con reintentos, presupuesto y cortacircuitos.
+
+LLM_PROVIDERS fija el orden de failover, p. ej. "groq,openai,stub":
+- groq:   API de Groq (clave en groq_api_key)
+- openai: cualquier endpoint compatible con /chat/completions de OpenAI
+- stub:   LLM determinista en proceso (ver stub_llm.py), sin red
+
+Cada proveedor tiene su timeout y su cortacircuitos: tras BREAKER_FAILURES fallos
+seguidos deja de llamarse durante BREAKER_RESET segundos y el router pasa al
+siguiente; si no queda ninguno, lanza LLMUnavailable al instante y el llamador
+usa el parser local. Los reintentos llevan jitter y salen de un presupuesto
+compartido, para que una caída no multiplique la carga sobre el proveedor.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import metrics
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))                 # reintentos por proveedor
+LLM_RETRY_RATIO = float(os.getenv("LLM_RETRY_RATIO", "0.2"))     # reintentos por petición
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.2"))       # segundos, backoff exponencial
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))          # segundos
+
+
+class LLMUnavailable(Exception):
+    """Ningún proveedor disponible o todos fallaron."""
+
+
+class CircuitBreaker:
+    """closed → open tras N fallos seguidos → half_open (una prueba) tras el reset."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.max_failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # En half_open se deja pasar otra prueba si la anterior nunca informó
+            if time.monotonic() - self.opened_at >= self.reset:
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Cubo de fichas: cada petición aporta `ratio` fichas y cada reintento gasta una."""
+
+    def __init__(self, ratio: float = LLM_RETRY_RATIO, initial: float = 10.0, cap: float = 100.0):
+        self.ratio = ratio
+        self.tokens = initial
+        self.cap = cap
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: evita que todos los reintentos lleguen a la vez
+    return random.uniform(0, LLM_RETRY_BASE * 2 ** attempt)
+
+
+# --- Proveedores ---
+
+class Provider:
+    name = "base"
+
+    def __init__(self, model: str, timeout: float = LLM_TIMEOUT):
+        self.model = model
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+
+    @property
+    def cache_id(self) -> str:
+        """Identifica en la caché de parseo quién generó una respuesta."""
+        return f"{self.name}/{self.model}"
+
+    def _messages(self, prompt: str) -> list[dict]:
+        return [{"role": "user", "content": prompt}]
+
+    def _usage(self, prompt_tokens, completion_tokens) -> None:
+        if prompt_tokens:
+            metrics.inc("llm_tokens_total", prompt_tokens, provider=self.name, kind="prompt")
+        if completion_tokens:
+            metrics.inc("llm_tokens_total", completion_tokens, provider=self.name, kind="completion")
+
+    async def complete(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str):
+        """Fragmentos de texto según los genera el modelo."""
+        yield await self.complete(prompt)
+
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    def __init__(self, api_key: str | None, model: str, timeout: float = LLM_TIMEOUT):
+        super().__init__(model, timeout)
+        self.api_key = api_key
+        self._async_client = None
+
+    # El cliente se crea al primer uso: sin clave solo falla la llamada, no el import
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from groq import AsyncGroq
+            self._async_client = AsyncGroq(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+        return self._async_client
+
+    async def complete(self, prompt: str) -> str:
+        self.calls += 1
+        response = await self.async_client.chat.completions.create(
+            model=self.model, messages=self._messages(prompt), temperature=0.2,
+        )
+        self._record_usage(response)
+        return response.choices[0].message.content
+
+    def _record_usage(self, response) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self._usage(usage.prompt_tokens, usage.completion_tokens)
+
+    async def stream(self, prompt: str):
+        self.calls += 1
+        stream = await self.async_client.chat.completions.create(
+            model=self.model, messages=self._messages(prompt), temperature=0.2, stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+class OpenAICompatProvider(Provider):
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str | None, model: str, timeout: float = LLM_TIMEOUT):
+        super().__init__(model, timeout)
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self.headers, timeout=self.timeout)
+        return self._async_client
+
+    def _body(self, prompt: str, stream: bool = False) -> dict:
+        return {"model": self.model, "messages": self._messages(prompt),
+                "temperature": 0.2, "stream": stream}
+
+    async def complete(self, prompt: str) -> str:
+        self.calls += 1
+        response = await self.async_client.post("/chat/completions", json=self._body(prompt))
+        return self._content(response)
+
+    def _content(self, response) -> str:
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get("usage") or {}
+        self._usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(self, prompt: str):
+        self.calls += 1
+        async with self.async_client.stream(
+            "POST", "/chat/completions", json=self._body(prompt, stream=True)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+class StubProvider(Provider):
+    """LLM determinista en proceso: misma respuesta que stub_llm.py, sin HTTP."""
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, seed: int = 0,
+                 timeout: float = LLM_TIMEOUT):
+        super().__init__("stub", timeout)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+
+    def _answer(self, prompt: str) -> str:
+        from stub_llm import fake_completion
+        self.calls += 1
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            raise RuntimeError("stub: fallo simulado")
+        return fake_completion(prompt)
+
+    async def complete(self, prompt: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def stream(self, prompt: str):
+        from stub_llm import split_chunks
+        pieces = split_chunks(self._answer(prompt))
+        for piece in pieces:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(pieces))
+            yield piece
+
+
+# --- Router con failover ---
+
+class Router:
+    def __init__(self, providers: list[Provider], retries: int = LLM_RETRIES,
+                 budget: RetryBudget | None = None):
+        self.providers = providers
+        self.retries = retries
+        self.budget = budget or RetryBudget()
+
+    @property
+    def primary(self) -> Provider | None:
+        return self.providers[0] if self.providers else None
+
+    def _attempts(self):
+        """(proveedor, intento) en orden de failover, saltando circuitos abiertos."""
+        self.budget.deposit()
+        for provider in self.providers:
+            for attempt in range(self.retries + 1):
+                if not provider.breaker.allow():
+                    metrics.inc("llm_circuit_open_total", provider=provider.name)
+                    break
+                if attempt and not self.budget.withdraw():
+                    break
+                yield provider, attempt
+
+    async def complete(self, prompt: str) -> tuple[Provider, str]:
+        """(proveedor que respondió, texto)."""
+        errors = []
+        for provider, attempt in self._attempts():
+            if attempt:
+                await asyncio.sleep(_backoff(attempt - 1))
+            start = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(provider.complete(prompt), provider.timeout)
+            except Exception as e:
+                self._failed(provider, attempt, e, start, errors)
+                continue
+            self._succeeded(provider, start)
+            return provider, text
+        raise LLMUnavailable("; ".join(errors) or "todos los circuitos abiertos")
+
+    async def stream(self, prompt: str):
+        """(proveedor, fragmento). Failover solo hasta el primer fragmento; después los
+        errores se propagan."""
+        errors = []
+        for provider, attempt in self._attempts():
+            if attempt:
+                await asyncio.sleep(_backoff(attempt - 1))
+            chunks = provider.stream(prompt)
+            start = time.perf_counter()
+            try:
+                try:
+                    first = await asyncio.wait_for(chunks.__anext__(), provider.timeout)
+                except StopAsyncIteration:
+                    self._succeeded(provider, start)
+                    return
+                except Exception as e:
+                    self._failed(provider, attempt, e, start, errors)
+                    continue
+                # En streaming se mide el tiempo hasta el primer fragmento
+                self._succeeded(provider, start)
+                yield provider, first
+                while True:
+                    # El plazo es por fragmento: una respuesta larga puede tardar más en total
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), provider.timeout)
+                    except StopAsyncIteration:
+                        return
+                    except Exception:
+                        provider.breaker.failure()
+                        raise
+                    yield provider, chunk
+            finally:
+                await chunks.aclose()
+        raise LLMUnavailable("; ".join(errors) or "todos los circuitos abiertos")
+
+    @staticmethod
+    def _succeeded(provider: Provider, start: float) -> None:
+        provider.breaker.success()
+        metrics.observe("llm_request_seconds", time.perf_counter() - start,
+                        provider=provider.name, outcome="ok")
+
+    @staticmethod
+    def _failed(provider: Provider, attempt: int, error: Exception, start: float, errors: list) -> None:
+        provider.breaker.failure()
+        outcome = "timeout" if isinstance(error, asyncio.TimeoutError) else "error"
+        metrics.observe("llm_request_seconds", time.perf_counter() - start,
+                        provider=provider.name, outcome=outcome)
+        errors.append(f"{provider.name}#{attempt}: {error!r}")
+
+    def health(self) -> dict:
+        return {
+            "providers": [
+                {"name": p.name, "model": p.model, "timeout": p.timeout,
+                 "state": p.breaker.state, "failures": p.breaker.failures, "calls": p.calls}
+                for p in self.providers
+            ],
+            "retry_tokens": round(self.budget.tokens, 2),
+        }
+
+
+def build_router(model: str) -> Router:
+    providers = []
+    for name in os.getenv("LLM_PROVIDERS", "groq").split(","):
+        name = name.strip()
+        if name == "groq":
+            providers.append(GroqProvider(
+                os.getenv("groq_api_key"), model,
+                float(os.getenv("GROQ_TIMEOUT", LLM_TIMEOUT)),
+            ))
+        elif name == "openai":
+            providers.append(OpenAICompatProvider(
+                os.getenv("OPENAI_BASE_URL", "http://localhost:8001/v1"),
+                os.getenv("OPENAI_API_KEY"),
+                os.getenv("OPENAI_MODEL", model),
+                float(os.getenv("OPENAI_TIMEOUT", LLM_TIMEOUT)),
+            ))
+        elif name == "stub":
+            providers.append(StubProvider(
+                float(os.getenv("STUB_LATENCY", "0")),
+                float(os.getenv("STUB_FAIL_RATE", "0")),
+            ))
+        elif name:
+            raise ValueError(f"proveedor de LLM desconocido: {name}")
+    return Router(providers)
@@ -0,0 +1,123 @@
+"""SQL de las consultas calientes.
+
+Los handlers y database.HOT_QUERIES usan estas mismas constantes, así que
+`python database.py --check-plans` (y tests/test_query_plans.py) comprueba el plan
+de lo que de verdad se ejecuta: si una consulta cambia y pierde su índice, falla.
+"""
+
+# --- Agenda y planificador (main.py) ---
+
+AGENDA_DAY = """
+    SELECT * FROM tasks
+    WHERE date = ?
+    ORDER BY position, priority, target_hour
+"""
+
+PLAN_DAY = "SELECT * FROM tasks WHERE date = ? AND status != 'done'"
+PLAN_RANGE = "SELECT * FROM tasks WHERE date BETWEEN ? AND ? AND status != 'done'"
+
+
+def agenda_range(columns: list[str], after: bool = False, statuses: int = 0,
+                 priorities: int = 0) -> str:
+    """GET /agenda: rango de días paginado por (date, position, id).
+
+    Parámetros en orden: desde, hasta, [cursor (date, position, id)], [estados],
+    [prioridades], limit.
+    """
+    where = ["date BETWEEN ? AND ?"]
+    if after:
+        where.append("(date, position, id) > (?, ?, ?)")
+    if statuses:
+        where.append(f"status IN ({', '.join('?' * statuses)})")
+    if priorities:
+        where.append(f"priority IN ({', '.join('?' * priorities)})")
+    return f"""
+        SELECT {', '.join(columns)} FROM tasks
+        WHERE {' AND '.join(where)}
+        ORDER BY date, position, id LIMIT ?
+    """
+
+
+# --- Búsqueda (main.py): ventana de rowid sin puntuar y bm25 dentro de ella ---
+
+SEARCH_WINDOW = """
+    SELECT tasks_fts.rowid FROM tasks_fts JOIN tasks t ON t.rowid = tasks_fts.rowid
+    WHERE tasks_fts MATCH ? AND t.date BETWEEN ? AND ?
+    ORDER BY tasks_fts.rowid DESC LIMIT ?
+"""
+
+SEARCH_RANKED = """
+    SELECT t.*, tasks_fts.rank AS rank FROM tasks_fts JOIN tasks t ON t.rowid = tasks_fts.rowid
+    WHERE tasks_fts MATCH ? AND tasks_fts.rowid BETWEEN ? AND ? AND t.date BETWEEN ? AND ?
+    ORDER BY tasks_fts.rank LIMIT ?
+"""
+
+# --- Feedback y estadísticas (main.py) ---
+
+FEEDBACK_LAST = """
+    SELECT date, score, notes FROM feedback
+    WHERE date = ? ORDER BY id DESC LIMIT 1
+"""
+
+DAY_STATS = "SELECT tasks_total, tasks_done FROM daily_stats WHERE date = ?"
+STATS_RANGE = "SELECT * FROM daily_stats WHERE date BETWEEN ? AND ? ORDER BY date"
+
+# --- Cambios (main.py /changes y events.py) ---
+
+CHANGES_HEAD = "SELECT COALESCE(MAX(seq), 0) FROM task_changes"
+CHANGES_SINCE = "SELECT seq, task_id, date, op FROM task_changes WHERE seq > ? ORDER BY seq LIMIT ?"
+CHANGES_SINCE_DATE = """
+    SELECT seq, task_id, date, op FROM task_changes
+    WHERE date = ? AND seq > ? ORDER BY seq LIMIT ?
+"""
+
+# --- Cola de trabajos (jobs.py) ---
+
+CLAIM_JOB = """
+    UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM jobs WHERE status = 'pending' AND run_after <= ?
+        ORDER BY run_after, id LIMIT 1
+    )
+    RETURNING id, kind, payload, attempts, max_attempts
+"""
+
+# --- Archivo (archive.py) ---
+
+ARCHIVED_MONTHS = "SELECT month FROM archived_months WHERE month BETWEEN ? AND ? ORDER BY month"
+
+# --- Heurísticas del learner (learner.py), una vez por feedback ---
+
+MORNING_COMPLETION = """
+    SELECT
+        SUM(CASE WHEN target_hour < '12:00' AND was_completed=1 THEN 1 ELSE 0 END) m_done,
+        SUM(CASE WHEN target_hour < '12:00' THEN 1 ELSE 0 END) m_total,
+        SUM(CASE WHEN target_hour >= '12:00' AND was_completed=1 THEN 1 ELSE 0 END) a_done,
+        SUM(CASE WHEN target_hour >= '12:00' THEN 1 ELSE 0 END) a_total
+    FROM task_patterns WHERE date=?
+"""
+
+POMODORO_ACCURACY = """
+    SELECT AVG(CAST(actual_pomodoros AS REAL) / estimated_pomodoros) ratio
+    FROM task_patterns WHERE date=? AND was_completed=1 AND estimated_pomodoros>0
+"""
+
+# Urgentes que quedaron pendientes (no aparecen en task_patterns)
+P1_SKIP = """
+    SELECT COUNT(*) p1_skip FROM tasks
+    WHERE date=? AND priority=1 AND status != 'done'
+"""
+
+# Opcionales completadas (sí aparecen en task_patterns)
+P3_DONE = """
+    SELECT COUNT(*) p3_done FROM task_patterns tp
+    JOIN tasks t ON t.id=tp.task_id
+    WHERE tp.date=? AND t.priority=3 AND tp.was_completed=1
+"""
+
+FIRST_COMPLETED_HOUR = """
+    SELECT target_hour FROM task_patterns
+    WHERE date = ? AND was_completed = 1
+    ORDER BY target_hour ASC LIMIT 1
+"""
@@ -0,0 +1,211 @@
+"""Repetición en bloque del aprendizaje: recalcula los pesos desde el histórico.
+
+learner.process_feedback mueve los pesos un día cada vez, con varias consultas por
+día. Aquí todo el histórico (base viva y archivo) se lee una vez en columnas y las
+señales por día se calculan en pasadas sobre esas listas. Después se pliegan sobre los
+feedbacks en orden, una vez por juego de parámetros, para:
+
+- reconstruir los pesos tras ajustar una heurística (--apply los guarda), o
+- comparar juegos de parámetros (backtest) sin tocar la base.
+
+    python replay.py [--params '{"morning_step": 0.1}' ...] [--apply] [--user ana]
+
+Diferencia con el aprendizaje en vivo: cada feedback se evalúa con los task_patterns
+de hoy, no con los que había cuando se envió.
+"""
+import time
+
+import archive
+from database import DEFAULT_USER, get_db, open_connection, use_user
+from learner import DEFAULT_WEIGHTS, PARAMS, save_weights
+from metrics import timed
+
+_ALL = ("0000-01-01", "9999-12-31")
+
+
+def load_history() -> dict:
+    """task_patterns, tasks y feedback de ambos niveles como listas por columna."""
+    conn = open_connection()
+    try:
+        patterns = archive.task_patterns(*_ALL, conn=conn)
+        sql = "SELECT id, date, priority, status FROM tasks"
+        tasks = [dict(r) for r in conn.execute(sql)]
+        tasks += archive.cold_rows(conn, *_ALL, sql, ())
+        feedback = conn.execute("SELECT date, score FROM feedback ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+    priority_of = {t["id"]: t["priority"] for t in tasks}
+    return {
+        "patterns": {
+            "date": [p["date"] for p in patterns],
+            "hour": [p["target_hour"] for p in patterns],
+            "estimated": [p["estimated_pomodoros"] for p in patterns],
+            "actual": [p["actual_pomodoros"] for p in patterns],
+            "completed": [p["was_completed"] == 1 for p in patterns],
+            # None si la tarea ya no existe: el JOIN del learner tampoco la cuenta
+            "priority": [priority_of.get(p["task_id"]) for p in patterns],
+        },
+        "tasks": {
+            "date": [t["date"] for t in tasks],
+            "priority": [t["priority"] for t in tasks],
+            "status": [t["status"] for t in tasks],
+        },
+        "feedback": {
+            "date": [f["date"] for f in feedback],
+            "score": [f["score"] for f in feedback],
+        },
+    }
+
+
+def day_signals(history: dict) -> dict:
+    """Agregados por día (solo los días con feedback), con la semántica SQL del learner."""
+    days = sorted(set(history["feedback"]["date"]))
+    index = {d: i for i, d in enumerate(days)}
+    n = len(days)
+    m_done, m_total, a_done, a_total = [0] * n, [0] * n, [0] * n, [0] * n
+    ratio_sum, ratio_n = [0.0] * n, [0] * n
+    p1_skip, p3_done = [0] * n, [0] * n
+    first_hour: list = [None] * n
+    null_hour = [False] * n
+
+    p = history["patterns"]
+    for d, hour, est, act, done, prio in zip(
+            p["date"], p["hour"], p["estimated"], p["actual"], p["completed"], p["priority"]):
+        i = index.get(d)
+        if i is None:
+            continue
+        # NULL < '12:00' y NULL >= '12:00' son ambos falsos en SQL: no cuenta en ningún lado
+        if hour is not None:
+            if hour < "12:00":
+                m_total[i] += 1
+                m_done[i] += done
+            else:
+                a_total[i] += 1
+                a_done[i] += done
+        if not done:
+            continue
+        if est is not None and est > 0:
+            ratio_sum[i] += act / est
+            ratio_n[i] += 1
+        if prio == 3:
+            p3_done[i] += 1
+        # ORDER BY target_hour pone los NULL primero: entonces el learner no ve hora
+        if hour is None:
+            null_hour[i] = True
+        elif first_hour[i] is None or hour < first_hour[i]:
+            first_hour[i] = hour
+
+    t = history["tasks"]
+    for d, prio, status in zip(t["date"], t["priority"], t["status"]):
+        i = index.get(d)
+        if i is not None and prio == 1 and status is not None and status != "done":
+            p1_skip[i] += 1
+
+    return {
+        "days": days,
+        "index": index,
+        "m_done": m_done, "m_total": m_total, "a_done": a_done, "a_total": a_total,
+        "ratio": [s / k if k else None for s, k in zip(ratio_sum, ratio_n)],
+        "priority_signal": [s > 0 and d > 0 for s, d in zip(p1_skip, p3_done)],
+        "first_hour": [None if nh else h for h, nh in zip(first_hour, null_hour)],
+    }
+
+
+def deltas(signals: dict, params: dict) -> dict:
+    """Columnas de deltas por día para un juego de parámetros (None = sin cambio)."""
+    lo = params["min_samples"]
+    margin, step = params["morning_margin"], params["morning_step"]
+    morning = []
+    for md, mt, ad, at in zip(signals["m_done"], signals["m_total"], signals["a_done"], signals["a_total"]):
+        if mt < lo or at < lo or not mt or not at:
+            morning.append(None)
+            continue
+        diff = md / mt - ad / at
+        morning.append(step if diff > margin else -step if diff < -margin else None)
+
+    high, low, pstep = params["ratio_high"], params["ratio_low"], params["pomodoro_step"]
+    pomodoro = [
+        None if r is None else pstep if r > high else -pstep if r < low else None
+        for r in signals["ratio"]
+    ]
+    priority = [params["priority_step"] if s else None for s in signals["priority_signal"]]
+    return {"morning_weight": morning, "pomodoro_accuracy": pomodoro, "priority_weight": priority}
+
+
+def fold(signals: dict, feedback: dict, params: dict, initial: dict | None = None) -> dict:
+    """Aplica los deltas en el orden de los feedbacks, como process_feedback uno a uno."""
+    weights = dict(initial or DEFAULT_WEIGHTS)
+    cols = deltas(signals, params)
+    lo, hi = params["weight_min"], params["weight_max"]
+    updates = 0
+    errors = []
+    for d, score in zip(feedback["date"], feedback["score"]):
+        i = signals["index"][d]
+        ratio = signals["ratio"][i]
+        if ratio is not None:
+            # Con qué peso se planificó ese día frente a lo que de verdad duraron las tareas
+            errors.append(abs(weights["pomodoro_accuracy"] - ratio))
+        for key in ("morning_weight", "pomodoro_accuracy", "priority_weight"):
+            delta = cols[key][i]
+            if delta is not None:
+                weights[key] = max(lo, min(hi, weights[key] + delta))
+                updates += 1
+        hour = signals["first_hour"][i]
+        if score < params["low_score"] and hour:
+            current = int(weights["preferred_start_hour"])
+            if int(hour.split(":")[0]) > current + 1:
+                weights["preferred_start_hour"] = max(params["start_hour_min"],
+                                                      current - params["start_hour_step"])
+                updates += 1
+    return {
+        "weights": weights,
+        "updates": updates,
+        "pomodoro_mae": round(sum(errors) / len(errors), 4) if errors else None,
+    }
+
+
+@timed("learner_seconds", fn="replay")
+def replay(param_sets: list[dict] | None = None, apply: bool = False) -> dict:
+    """Reproduce el histórico con cada juego de parámetros (sobre PARAMS).
+
+    Con apply=True los pesos del primer juego sustituyen a los aprendidos.
+    """
+    param_sets = param_sets or [{}]
+    unknown = {k for p in param_sets for k in p} - set(PARAMS)
+    if unknown:
+        raise ValueError(f"parámetros desconocidos: {sorted(unknown)}")
+
+    start = time.perf_counter()
+    history = load_history()
+    signals = day_signals(history)
+    results = []
+    for overrides in param_sets:
+        params = PARAMS | overrides
+        results.append({"params": overrides} | fold(signals, history["feedback"], params))
+
+    if apply:
+        with get_db() as conn:
+            save_weights(results[0]["weights"], conn)
+    return {
+        "days": len(signals["days"]),
+        "feedback": len(history["feedback"]["date"]),
+        "patterns": len(history["patterns"]["date"]),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        "applied": apply,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--params", action="append", type=json.loads, default=[],
+                    help="JSON con los parámetros a cambiar; se puede repetir")
+    ap.add_argument("--apply", action="store_true", help="guarda los pesos del primer juego")
+    ap.add_argument("--user", default=DEFAULT_USER, help="shard del usuario a reproducir")
+    args = ap.parse_args()
+    with use_user(args.user):
+        print(json.dumps(replay(args.params or [{}], args.apply), indent=2))
@@ -0,0 +1,125 @@
+"""LLM local y determinista con la API de chat de OpenAI, para pruebas y carga.
+
+Responde a partir del parser local, así que no necesita red ni claves:
+
+    python stub_llm.py --port 8001 --latency 0.2 [--fail-rate 0.1]
+
+y en el backend:
+
+    LLM_PROVIDERS=openai OPENAI_BASE_URL=http://localhost:8001/v1
+
+Con stream=true responde en fragmentos SSE como la API real.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from local_parser import parse_local
+
+_TASK_TEXT = re.compile(r'Tarea: "(.*)"', re.S)
+_DAY_TEXT = re.compile(r'Texto: "(.*)"', re.S)
+_SENTENCES = re.compile(r"(?<=[.;\n])\s+|\s+y luego\s+|\s+después\s+")
+
+
+def fake_completion(prompt: str) -> str:
+    """Respuesta con la forma que pide el prompt (objeto de tarea o array del día)."""
+    m = _DAY_TEXT.search(prompt)
+    if m:
+        parts = [p.strip(" .;") for p in _SENTENCES.split(m.group(1)) if p.strip(" .;")]
+        return json.dumps([parse_local(p)[0] for p in parts], ensure_ascii=False)
+    m = _TASK_TEXT.search(prompt)
+    texto = m.group(1) if m else prompt
+    return json.dumps(parse_local(texto)[0], ensure_ascii=False)
+
+
+def split_chunks(content: str, size: int = 16) -> list[str]:
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.lock:
+            fail = self.rng.random() < self.fail_rate
+        if fail:
+            self._json(503, {"error": {"message": "stub: fallo simulado"}})
+            return
+
+        content = fake_completion(body["messages"][-1]["content"])
+        model = body.get("model", "stub")
+        if not body.get("stream"):
+            time.sleep(self.latency)
+            self._json(200, {
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            })
+            return
+
+        chunks = split_chunks(content)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for piece in chunks:
+            time.sleep(self.latency / len(chunks))
+            event = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8001, latency: float = 0.0,
+                fail_rate: float = 0.0, seed: int = 0) -> ThreadingHTTPServer:
+    handler = type("StubHandler", (_Handler,), {
+        "latency": latency, "fail_rate": fail_rate,
+        "rng": random.Random(seed), "lock": threading.Lock(),
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--latency", type=float, default=0.0, help="segundos por respuesta")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    server = make_server(args.host, args.port, args.latency, args.fail_rate, args.seed)
+    print(f"LLM stub en http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
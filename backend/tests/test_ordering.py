@@ -0,0 +1,122 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import ordering  # noqa: E402
+
+DAY = "2026-03-02"
+
+
+@pytest.fixture
+def conn():
+    conn = database._connect(":memory:")
+    database.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def _insert(conn, titles, day=DAY):
+    # Mismo cálculo que guardar_tareas: cada tarea nueva al final del día
+    ids = []
+    for title in titles:
+        conn.execute(
+            "INSERT INTO tasks (id, title, date, position) VALUES (?, ?, ?, ?)",
+            (title, title, day, ordering.next_position(conn, day)),
+        )
+        ids.append(title)
+    return ids
+
+
+def _order(conn, day=DAY):
+    return [r["id"] for r in conn.execute(
+        "SELECT id FROM tasks WHERE date = ? ORDER BY position, priority, target_hour", (day,))]
+
+
+def test_inserts_append_in_order(conn):
+    _insert(conn, ["a", "b", "c"])
+    assert _order(conn) == ["a", "b", "c"]
+    positions = [r[0] for r in conn.execute("SELECT position FROM tasks ORDER BY position")]
+    assert positions == [0, ordering.GAP, 2 * ordering.GAP]
+    # Otro día empieza de nuevo en 0
+    assert ordering.next_position(conn, "2026-03-03") == 0
+
+
+def test_move_between_neighbours_writes_midpoint(conn):
+    _insert(conn, ["a", "b", "c"])
+    result = ordering.move_task(conn, "c", "a", "b")
+    assert result == {"id": "c", "position": ordering.GAP / 2, "rebalanced": False}
+    assert _order(conn) == ["a", "c", "b"]
+
+
+def test_move_to_edges(conn):
+    _insert(conn, ["a", "b", "c"])
+    ordering.move_task(conn, "c", None, "a")
+    assert _order(conn) == ["c", "a", "b"]
+    ordering.move_task(conn, "c", "b", None)
+    assert _order(conn) == ["a", "b", "c"]
+
+
+def test_move_without_neighbours_appends(conn):
+    _insert(conn, ["a", "b", "c"])
+    result = ordering.move_task(conn, "a", None, None)
+    assert result["position"] == 3 * ordering.GAP
+    assert _order(conn) == ["b", "c", "a"]
+    # La última ya está al final: no se mueve más allá de sí misma
+    assert ordering.move_task(conn, "a", None, None)["position"] == 3 * ordering.GAP
+
+
+def test_rebalance_only_when_gap_is_exhausted(conn):
+    _insert(conn, ["a", "b", "c", "d"])
+    rebalanced = []
+    # Siempre entre las dos primeras: el hueco se divide por dos en cada paso
+    for _ in range(40):
+        first, second, *_, last = _order(conn)
+        rebalanced.append(ordering.move_task(conn, last, first, second)["rebalanced"])
+    assert True in rebalanced
+    # ~1024 / 2^n < 1e-6 tras unos 30 pasos, no antes
+    assert rebalanced.index(True) >= 25
+    assert len(set(_order(conn))) == 4
+
+
+def test_rebalance_breaks_ties(conn):
+    _insert(conn, ["a", "b", "c"])
+    conn.execute("UPDATE tasks SET position = 0")
+    before = _order(conn)
+    result = ordering.move_task(conn, "c", before[0], before[1])
+    assert result["rebalanced"] is True
+    assert _order(conn) == [before[0], "c", before[1]]
+
+
+def test_rebalance_keeps_order(conn):
+    _insert(conn, ["a", "b", "c"])
+    ordering.move_task(conn, "c", None, "a")
+    assert ordering.rebalance(conn, DAY) == 3
+    assert _order(conn) == ["c", "a", "b"]
+    positions = [r[0] for r in conn.execute("SELECT position FROM tasks ORDER BY position")]
+    assert positions == [0, ordering.GAP, 2 * ordering.GAP]
+
+
+def test_move_missing_task_or_neighbour(conn):
+    _insert(conn, ["a", "b"])
+    assert ordering.move_task(conn, "nope", "a", None) is None
+    assert ordering.move_task(conn, "a", "nope", None) is None
+
+
+@pytest.mark.parametrize("after_id, before_id", [
+    ("a", None),      # la propia tarea
+    (None, "a"),
+    ("c", "b"),       # orden invertido
+    ("b", "b"),
+    ("x", None),      # otro día
+])
+def test_move_rejects_invalid_neighbours(conn, after_id, before_id):
+    _insert(conn, ["a", "b", "c"])
+    _insert(conn, ["x"], day="2026-03-03")
+    before = _order(conn)
+    with pytest.raises(ValueError):
+        ordering.move_task(conn, "a", after_id, before_id)
+    assert _order(conn) == before
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def _migrated():
+    conn = database._connect(":memory:")
+    database.migrate(conn)
+    return conn
+
+
+def test_hot_queries_use_indexes():
+    conn = _migrated()
+    try:
+        assert database.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_check_detects_missing_index():
+    conn = _migrated()
+    try:
+        conn.execute("DROP INDEX idx_feedback_date")
+        assert database.check_query_plans(conn) == ["feedback_last: SCAN feedback"]
+    finally:
+        conn.close()
@@ -23,7 +23,10 @@ export function TaskInput() {
     setLoading(true);
     try {
       if (dayMode) {
-        const tasks = await addTasksDayPlan(text);
+        setDayPreview(null);
+        const tasks = await addTasksDayPlan(text, (task) =>
+          setDayPreview((prev) => [...(prev ?? []), task]),
+        );
         setDayPreview(tasks);
       } else {
         await addTaskFromText(text, priority);
@@ -19,7 +19,7 @@ import { ChevronDown } from "lucide-react";
 import { useState } from "react";
 
 export function TaskList() {
-  const { tasks, isLoading, reorderTasks } = useAgendaStore();
+  const { tasks, isLoading, moveTask } = useAgendaStore();
   const [showDone, setShowDone] = useState(false);
 
   const sensors = useSensors(
@@ -37,7 +37,11 @@ export function TaskList() {
     const oldIndex = pending.findIndex((t) => t.id === active.id);
     const newIndex = pending.findIndex((t) => t.id === over.id);
     const reordered = arrayMove(pending, oldIndex, newIndex);
-    reorderTasks(reordered.map((t) => t.id));
+    moveTask(
+      String(active.id),
+      reordered[newIndex - 1]?.id ?? null,
+      reordered[newIndex + 1]?.id ?? null,
+    );
   };
 
   if (isLoading) {
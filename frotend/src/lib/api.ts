@@ -2,9 +2,18 @@ import type { Task, Feedback, DayStats, WeekStats } from "./types";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
+// Each user's data lives in its own backend shard, selected by X-User-Id
+// (or ?user= where headers can't be set). Without one, the shared default shard.
+const USER_ID: string | null = import.meta.env.VITE_USER_ID || localStorage.getItem("agenda-user");
+
+const headers = (): Record<string, string> => ({
+  "Content-Type": "application/json",
+  ...(USER_ID ? { "X-User-Id": USER_ID } : {}),
+});
+
 async function request<T>(path: string, options?: RequestInit): Promise<T> {
   const res = await fetch(`${API_BASE}${path}`, {
-    headers: { "Content-Type": "application/json" },
+    headers: headers(),
     ...options,
   });
   if (!res.ok) {
@@ -21,7 +30,7 @@ export const parseTask = (text: string, _priorityHint?: number) =>
     body: JSON.stringify({ texto: text }),
   });
 
-// Create task — backend returns {id, mensaje}, reconstruct full Task locally
+// Create task — backend: POST /tasks returns {id, mensaje, task} with the stored row
 export const createTask = async (task: {
   title: string;
   priority: number;
@@ -30,31 +39,67 @@ export const createTask = async (task: {
   context: string | null;
   date: string;
 }): Promise<Task> => {
-  const created = await request<{ id: string }>("/tasks", {
+  const created = await request<{ id: string; task: Task }>("/tasks", {
     method: "POST",
     body: JSON.stringify(task),
   });
-  return {
-    id: created.id,
-    title: task.title,
-    context: task.context,
-    priority: task.priority as 1 | 2 | 3,
-    pomodoros: task.pomodoros,
-    pomodoros_done: 0,
-    target_hour: task.target_hour,
-    suggested_hour: null,
-    status: "pending",
-    date: task.date,
-    position: 0,
-    created_at: new Date().toISOString(),
-    done_at: null,
-  };
+  return created.task;
 };
 
+// Bulk create — backend: POST /tasks/bulk {tasks, strict} inserts in one transaction
+export const createTasksBulk = (
+  tasks: Array<{
+    title: string;
+    priority: number;
+    pomodoros: number;
+    target_hour: string | null;
+    context: string | null;
+    date: string;
+  }>,
+  strict = false,
+) =>
+  request<{ tasks: Task[]; count: number; errors: Array<{ index: number; error: unknown }> }>(
+    "/tasks/bulk",
+    {
+      method: "POST",
+      body: JSON.stringify({ tasks, strict }),
+    },
+  );
+
 // Get tasks for a date — backend: GET /agenda/{fecha} returns Task[]
 export const getTasks = (date: string) =>
   request<Task[]>(`/agenda/${date}`);
 
+// Delta sync — backend: GET /changes?since=&fecha= returns rows changed after the cursor.
+// Without `since` it only returns the current cursor.
+export interface Changes {
+  cursor: number;
+  tasks: Task[];
+  deleted: string[];
+  has_more: boolean;
+}
+
+export const getChanges = (since?: number, date?: string) => {
+  const params = new URLSearchParams();
+  if (since !== undefined) params.set("since", String(since));
+  if (date) params.set("fecha", date);
+  return request<Changes>(`/changes?${params}`);
+};
+
+// Push channel — backend: GET /agenda/{fecha}/events (SSE: task-changed, plan-invalidated,
+// weights-changed, resync). EventSource reconnects by itself sending Last-Event-ID.
+export const subscribeAgenda = (
+  date: string,
+  onEvent: (type: string, data: unknown) => void,
+): (() => void) => {
+  const query = USER_ID ? `?user=${encodeURIComponent(USER_ID)}` : "";
+  const source = new EventSource(`${API_BASE}/agenda/${date}/events${query}`);
+  for (const type of ["task-changed", "plan-invalidated", "weights-changed", "resync"]) {
+    source.addEventListener(type, (e) => onEvent(type, JSON.parse((e as MessageEvent).data)));
+  }
+  return () => source.close();
+};
+
 // Update any task fields — backend: PATCH /tasks/{id}
 export const updateTask = (id: string, updates: Partial<Task>) =>
   request<Task>(`/tasks/${id}`, {
@@ -69,6 +114,13 @@ export const deleteTask = (id: string) =>
     body: JSON.stringify({ status: "cancelled" }),
   });
 
+// Move one task between its new neighbours — backend: PATCH /tasks/{id}/move (one row write)
+export const moveTask = (id: string, afterId: string | null, beforeId: string | null) =>
+  request<{ id: string; position: number; rebalanced: boolean }>(`/tasks/${id}/move`, {
+    method: "PATCH",
+    body: JSON.stringify({ after_id: afterId, before_id: beforeId }),
+  });
+
 // Reorder — backend: PATCH /tasks/reorder [{id, position}]
 export const reorderTasks = (taskIds: string[]) =>
   request<{ ok: boolean }>("/tasks/reorder", {
@@ -90,6 +142,78 @@ export const parseDayPlan = (text: string) =>
     body: JSON.stringify({ texto: text }),
   });
 
+// Streaming parse — backend: POST /parse-day/stream emits one NDJSON task per line as the
+// model finishes it. Calls onTask for each one and resolves with the full list.
+export const parseDayPlanStream = async (
+  text: string,
+  onTask: (task: Partial<Task>) => void,
+): Promise<Partial<Task>[]> => {
+  const res = await fetch(`${API_BASE}/parse-day/stream`, {
+    method: "POST",
+    headers: headers(),
+    body: JSON.stringify({ texto: text }),
+  });
+  if (!res.ok || !res.body) throw new Error(await res.text().catch(() => "Unknown error"));
+
+  const tasks: Partial<Task>[] = [];
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const task = JSON.parse(line) as Partial<Task>;
+      tasks.push(task);
+      onTask(task);
+    }
+  }
+  return tasks;
+};
+
+// Date range in one query — backend: GET /agenda?from=&to= with keyset pagination.
+// Follows next_cursor until the range is exhausted.
+export const getAgendaRange = async (
+  from: string,
+  to: string,
+  opts: { status?: Task["status"][]; priority?: number[]; fields?: (keyof Task)[] } = {},
+): Promise<Task[]> => {
+  const tasks: Task[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ from, to, limit: "500" });
+    if (opts.status?.length) params.set("status", opts.status.join(","));
+    if (opts.priority?.length) params.set("priority", opts.priority.join(","));
+    if (opts.fields?.length) params.set("fields", opts.fields.join(","));
+    if (cursor) params.set("cursor", cursor);
+    const page = await request<{ tasks: Task[]; next_cursor: string | null }>(`/agenda?${params}`);
+    tasks.push(...page.tasks);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return tasks;
+};
+
+// Full-text search over title and context — backend: GET /tasks/search (FTS5).
+// Accent-insensitive; the last word matches as a prefix, so it works while typing.
+// Only the newest matches are ranked: `truncated` means older, possibly better
+// matches were left out — narrow `from`/`to` to reach them.
+export const searchTasks = async (
+  q: string,
+  opts: { from?: string; to?: string; limit?: number } = {},
+): Promise<{ tasks: (Task & { rank: number })[]; truncated: boolean }> => {
+  const params = new URLSearchParams({ q });
+  if (opts.from) params.set("from", opts.from);
+  if (opts.to) params.set("to", opts.to);
+  if (opts.limit) params.set("limit", String(opts.limit));
+  const res = await request<{ tasks: (Task & { rank: number })[]; count: number; truncated: boolean }>(
+    `/tasks/search?${params}`,
+  );
+  return { tasks: res.tasks, truncated: res.truncated };
+};
+
 // Get agenda — backend returns flat Task[], compute stats here
 export const getAgenda = async (date: string): Promise<{ tasks: Task[]; stats: DayStats }> => {
   const tasks = await request<Task[]>(`/agenda/${date}`);
@@ -102,20 +226,25 @@ export const getAgenda = async (date: string): Promise<{ tasks: Task[]; stats: D
   return { tasks, stats };
 };
 
-// Feedback — backend: POST /feedback {date, score, notes}
+// Feedback — backend: POST /feedback {date, score, notes}; learning runs as a background job
 export const submitFeedback = (date: string, score: number, notes?: string) =>
-  request<Feedback>("/feedback", {
+  request<{ ok: boolean; job_id: number; learning: string }>("/feedback", {
     method: "POST",
     body: JSON.stringify({ date, score, notes }),
   });
 
-// Not implemented in backend — return null
-export const getFeedback = (_date: string): Promise<Feedback | null> =>
-  Promise.resolve(null);
+// Background job status — backend: GET /jobs/{id} (pending | running | done | failed)
+export const getJob = (id: number) =>
+  request<{ id: number; kind: string; status: string; attempts: number; result: unknown; error: string | null }>(
+    `/jobs/${id}`,
+  );
+
+// Feedback for a date — backend: GET /feedback/{fecha}, 404 when there is none yet
+export const getFeedback = (date: string): Promise<Feedback | null> =>
+  request<Feedback>(`/feedback/${date}`).catch(() => null);
 
-// Not implemented in backend — return empty stats
-export const getStats = (_days = 7): Promise<WeekStats> =>
-  Promise.resolve({ days: [], avg_score: 0, completion_rate: 0, total_pomodoros: 0 });
+// Last N days from the incrementally maintained daily_stats — backend: GET /stats?days=N
+export const getStats = (days = 7) => request<WeekStats>(`/stats?days=${days}`);
 
 // Not implemented in backend — return empty prefs
 export const getPrefs = (): Promise<Record<string, unknown>> =>
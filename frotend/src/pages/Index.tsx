@@ -1,5 +1,6 @@
 import { useEffect } from "react";
 import { useAgendaStore } from "@/store/useAgendaStore";
+import * as api from "@/lib/api";
 import { Header } from "@/components/Header";
 import { TaskInput } from "@/components/TaskInput";
 import { TaskList } from "@/components/TaskList";
@@ -7,12 +8,21 @@ import { PomodoroBar } from "@/components/PomodoroBar";
 import { StatsPanel } from "@/components/StatsPanel";
 
 const Index = () => {
-  const { fetchAgenda, currentDate } = useAgendaStore();
+  const { fetchAgenda, syncChanges, currentDate } = useAgendaStore();
 
   useEffect(() => {
     fetchAgenda();
   }, [currentDate, fetchAgenda]);
 
+  // Cambios de otras pestañas o dispositivos: se aplican con una sincronización delta
+  useEffect(
+    () =>
+      api.subscribeAgenda(currentDate, (type) => {
+        if (type === "task-changed" || type === "resync") syncChanges();
+      }),
+    [currentDate, syncChanges],
+  );
+
   return (
     <div className="min-h-screen bg-background">
       <div className="max-w-3xl mx-auto lg:mr-auto lg:ml-[calc(50%-24rem)]">
@@ -39,6 +39,7 @@ interface AgendaState {
   dayStats: DayStats | null;
   weekStats: WeekStats | null;
   activePomodoro: ActivePomodoro | null;
+  syncCursor: number | null;
 
   setCurrentDate: (date: string) => void;
   goNextDay: () => void;
@@ -46,12 +47,14 @@ interface AgendaState {
   goToday: () => void;
 
   fetchAgenda: (date?: string) => Promise<void>;
+  syncChanges: () => Promise<void>;
   addTaskFromText: (text: string, priorityHint?: number) => Promise<void>;
-  addTasksDayPlan: (text: string) => Promise<Partial<Task>[]>;
+  addTasksDayPlan: (text: string, onTask?: (task: Partial<Task>) => void) => Promise<Partial<Task>[]>;
   confirmDayPlan: (tasks: Partial<Task>[]) => Promise<void>;
   updateTask: (id: string, updates: Partial<Task>) => Promise<void>;
   removeTask: (id: string) => Promise<void>;
   reorderTasks: (ids: string[]) => Promise<void>;
+  moveTask: (id: string, afterId: string | null, beforeId: string | null) => Promise<void>;
   completeTask: (id: string) => Promise<void>;
   postponeTask: (id: string) => Promise<void>;
 
@@ -71,6 +74,7 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
   dayStats: null,
   weekStats: null,
   activePomodoro: null,
+  syncCursor: null,
 
   setCurrentDate: (date) => {
     set({ currentDate: date });
@@ -90,8 +94,15 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
     const d = date || get().currentDate;
     set({ isLoading: true });
     try {
+      // El cursor se pide antes que la agenda: un cambio intermedio se repite, no se pierde
+      const head = await api.getChanges().catch(() => null);
       const data = await api.getAgenda(d);
-      set({ tasks: data.tasks, dayStats: data.stats, isLoading: false });
+      set({
+        tasks: data.tasks,
+        dayStats: data.stats,
+        syncCursor: head ? head.cursor : null,
+        isLoading: false,
+      });
     } catch {
       // fallback to getTasks
       try {
@@ -113,6 +124,41 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
     }
   },
 
+  syncChanges: async () => {
+    const { syncCursor, currentDate } = get();
+    if (syncCursor === null) return get().fetchAgenda();
+    try {
+      let cursor = syncCursor;
+      let tasks = get().tasks;
+      for (;;) {
+        const changes = await api.getChanges(cursor, currentDate);
+        const changed = new Map(changes.tasks.map((t) => [t.id, t]));
+        const removed = new Set(changes.deleted);
+        tasks = tasks
+          .filter((t) => !removed.has(t.id))
+          .map((t) => changed.get(t.id) ?? t);
+        const known = new Set(tasks.map((t) => t.id));
+        tasks = [...tasks, ...changes.tasks.filter((t) => !known.has(t.id))];
+        cursor = changes.cursor;
+        if (!changes.has_more) break;
+      }
+      if (get().currentDate !== currentDate) return;
+      tasks.sort((a, b) => a.position - b.position || a.priority - b.priority);
+      set({
+        tasks,
+        syncCursor: cursor,
+        dayStats: {
+          total: tasks.length,
+          done: tasks.filter((t) => t.status === "done").length,
+          pomodoros_done: tasks.reduce((s, t) => s + t.pomodoros_done, 0),
+          pomodoros_total: tasks.reduce((s, t) => s + t.pomodoros, 0),
+        },
+      });
+    } catch {
+      get().fetchAgenda();
+    }
+  },
+
   addTaskFromText: async (text, priorityHint) => {
     try {
       const parsed = await api.parseTask(text, priorityHint);
@@ -126,29 +172,34 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
       });
       set((s) => ({ tasks: [...s.tasks, task] }));
       toast.success(`Tarea añadida: ${task.title}`);
-      get().fetchAgenda();
+      get().syncChanges();
     } catch {
       toast.error("La IA no pudo interpretar tu texto. Intenta ser más específico.");
     }
   },
 
-  addTasksDayPlan: async (text) => {
-    return api.parseDayPlan(text);
+  addTasksDayPlan: async (text, onTask) => {
+    if (!onTask) return api.parseDayPlan(text);
+    // Cada tarea llega en cuanto el modelo la termina; sin streaming se usa la respuesta completa
+    return api.parseDayPlanStream(text, onTask).catch(() => api.parseDayPlan(text));
   },
 
   confirmDayPlan: async (tasks) => {
-    for (const t of tasks) {
-      await api.createTask({
+    const result = await api.createTasksBulk(
+      tasks.map((t) => ({
         title: t.title || "",
         priority: (t.priority as 1 | 2 | 3) || 3,
         pomodoros: t.pomodoros || 1,
         target_hour: t.target_hour || null,
         context: t.context || null,
         date: get().currentDate,
-      });
+      })),
+    );
+    if (result.errors.length) {
+      toast.error(`${result.errors.length} tareas no se pudieron añadir`);
     }
-    toast.success(`${tasks.length} tareas añadidas`);
-    get().fetchAgenda();
+    toast.success(`${result.count} tareas añadidas`);
+    get().syncChanges();
   },
 
   updateTask: async (id, updates) => {
@@ -183,12 +234,43 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
     }
   },
 
+  moveTask: async (id, afterId, beforeId) => {
+    const tasks = get().tasks;
+    const after = tasks.find((t) => t.id === afterId);
+    const before = tasks.find((t) => t.id === beforeId);
+    // Posición optimista; el backend devuelve la definitiva
+    const optimistic =
+      after && before
+        ? (after.position + before.position) / 2
+        : after
+          ? after.position + 1
+          : before
+            ? before.position - 1
+            : 0;
+    set((s) => ({
+      tasks: s.tasks.map((t) => (t.id === id ? { ...t, position: optimistic } : t)),
+    }));
+    try {
+      const moved = await api.moveTask(id, afterId, beforeId);
+      if (moved.rebalanced) {
+        get().syncChanges();
+      } else {
+        set((s) => ({
+          tasks: s.tasks.map((t) => (t.id === id ? { ...t, position: moved.position } : t)),
+        }));
+      }
+    } catch {
+      toast.error("Error al reordenar");
+      get().fetchAgenda();
+    }
+  },
+
   completeTask: async (id) => {
     try {
       const updated = await api.updateTask(id, { status: "done" });
       set((s) => ({ tasks: s.tasks.map((t) => (t.id === id ? updated : t)) }));
       toast.success("¡Tarea completada!");
-      get().fetchAgenda();
+      get().syncChanges();
     } catch {
       toast.error("Error al completar tarea");
     }
@@ -300,7 +382,7 @@ export const useAgendaStore = create<AgendaState>((set, get) => ({
       const stats = await api.getStats(7);
       set({ weekStats: stats });
     } catch {
-      // getStats no está implementado en el backend — falla silenciosamente
+      // Sin conexión con el backend — se mantienen las estadísticas anteriores
     }
   },
 }));